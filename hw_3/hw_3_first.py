@@ -1,51 +1,362 @@
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import cpu_count, shared_memory
+from numbers import Integral
+from operator import add, mul
+
 import numpy as np
 
+BLOCK_SIZE = 64
+# Ниже этого числа умножений (n * m * p) процессы не окупают запуск
+PARALLEL_MIN_OPS = 64 ** 3
+
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+DTYPES = {
+    'int64': 'q',
+    'float64': 'd',
+    # Целые вне диапазона int64 хранятся списком Python int, как до перехода на array
+    'object': None,
+}
+
+
+def _infer_dtype(values):
+    # numbers.Integral покрывает и целые типы NumPy (np.int64 и т.п.), не только int
+    if not all(isinstance(x, Integral) for x in values):
+        return 'float64'
+    if values and (min(values) < INT64_MIN or max(values) > INT64_MAX):
+        return 'object'
+    return 'int64'
+
+
+def _result_dtype(left, right):
+    dtypes = (left.dtype, right.dtype)
+    if 'float64' in dtypes:
+        return 'float64'
+    return 'object' if 'object' in dtypes else 'int64'
+
+
+def _typed_buffer(values, dtype):
+    code = DTYPES[dtype]
+    return list(values) if code is None else array(code, values)
+
+
+def _build_buffer(make_values, dtype):
+    # Результат целочисленной операции может не поместиться в int64: тогда значения
+    # строятся заново (make_values вызывается второй раз) и хранятся как 'object'
+    try:
+        return _typed_buffer(make_values(), dtype), dtype
+    except OverflowError:
+        if dtype != 'int64':
+            raise
+        return list(make_values()), 'object'
+
+
+def _buffer_nbytes(buf):
+    if isinstance(buf, array):
+        return buf.itemsize * len(buf)
+    return sys.getsizeof(buf) + sum(sys.getsizeof(x) for x in buf)
+
+
+def _transpose_flat(b, m, p):
+    return [b[k * p + j] for j in range(p) for k in range(m)]
+
+
+# Все ядра принимают плоские row-major буферы: a размером n x m, b размером m x p
+def matmul_naive(a, b, n, m, p):
+    return [
+        sum(a[i * m + k] * b[k * p + j] for k in range(m))
+        for i in range(n)
+        for j in range(p)
+    ]
+
+
+def matmul_transposed(a, b, n, m, p):
+    bt = _transpose_flat(b, m, p)
+    b_cols = [bt[j * m:(j + 1) * m] for j in range(p)]
+
+    result = []
+    for i in range(n):
+        a_row = a[i * m:(i + 1) * m]
+        result.extend(sum(map(mul, a_row, col)) for col in b_cols)
+    return result
+
+
+def matmul_ikj(a, b, n, m, p):
+    b_rows = [b[k * p:(k + 1) * p] for k in range(m)]
+
+    result = []
+    for i in range(n):
+        c_row = [0] * p
+        for k, a_ik in enumerate(a[i * m:(i + 1) * m]):
+            if a_ik:
+                c_row = [c + a_ik * b_kj for c, b_kj in zip(c_row, b_rows[k])]
+        result.extend(c_row)
+    return result
+
+
+def matmul_blocked(a, b, n, m, p, block_size=BLOCK_SIZE):
+    result = [0] * (n * p)
+    for kk in range(0, m, block_size):
+        k_end = min(kk + block_size, m)
+        for jj in range(0, p, block_size):
+            j_end = min(jj + block_size, p)
+            b_block = [b[k * p + jj:k * p + j_end] for k in range(kk, k_end)]
+
+            for i in range(n):
+                c_start = i * p + jj
+                c_block = result[c_start:c_start + j_end - jj]
+                for k in range(kk, k_end):
+                    a_ik = a[i * m + k]
+                    if a_ik:
+                        b_row = b_block[k - kk]
+                        c_block = [c + a_ik * b_kj for c, b_kj in zip(c_block, b_row)]
+                result[c_start:c_start + j_end - jj] = c_block
+    return result
+
+
+MATMUL_BACKENDS = {
+    'naive': matmul_naive,
+    'transposed': matmul_transposed,
+    'ikj': matmul_ikj,
+    'blocked': matmul_blocked,
+}
+
+
+def _to_shared(buf):
+    nbytes = buf.itemsize * len(buf)
+    shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+    shm.buf[:nbytes] = memoryview(buf).cast('B')
+    return shm
+
+
+def _row_bands(rows, n_bands):
+    size, extra = divmod(rows, n_bands)
+    start = 0
+    for i in range(n_bands):
+        stop = start + size + (1 if i < extra else 0)
+        if stop > start:
+            yield start, stop
+        start = stop
+
+
+def _matmul_band(a_name, b_name, out_name, typecodes, n, m, p, start, stop, backend):
+    shms = [shared_memory.SharedMemory(name=name) for name in (a_name, b_name, out_name)]
+    views = [shm.buf.cast(code) for shm, code in zip(shms, typecodes)]
+    try:
+        a_view, b_view, out_view = views
+        a_band = a_view[start * m:stop * m].tolist()
+        b = b_view[:m * p].tolist()
+        flat = MATMUL_BACKENDS[backend](a_band, b, stop - start, m, p)
+        out_view[start * p:stop * p] = array(typecodes[2], flat)
+    finally:
+        for view in views:
+            view.release()
+        for shm in shms:
+            shm.close()
+
 
 class Matrix:
-    def __init__(self, data):
-        self.data = data
-        self.rows = len(data)
-        self.cols = len(data[0]) if self.rows > 0 else 0
+    __slots__ = ('_buf', '_view', 'rows', 'cols', 'dtype')
+
+    matmul_backend = 'transposed'
+
+    def __init__(self, data, dtype=None):
+        rows = len(data)
+        cols = len(data[0]) if rows > 0 else 0
 
         for row in data:
-            if len(row) != self.cols:
+            if len(row) != cols:
                 raise ValueError("Длина рядов должна совпадать")
 
+        flat = [x for row in data for x in row]
+        if dtype is None:
+            dtype = _infer_dtype(flat)
+        if dtype not in DTYPES:
+            raise ValueError(f"Неподдерживаемый тип данных: {dtype}")
+
+        try:
+            buf = _typed_buffer(flat, dtype)
+        except OverflowError:
+            raise ValueError(f"Значения не помещаются в {dtype}, используйте dtype='object'") from None
+        self._init_flat(buf, rows, cols, dtype)
+
+    def _init_flat(self, buf, rows, cols, dtype):
+        self._buf = buf
+        self._view = memoryview(buf) if isinstance(buf, array) else buf
+        self.rows = rows
+        self.cols = cols
+        self.dtype = dtype
+
+    @classmethod
+    def _from_flat(cls, flat, rows, cols, dtype):
+        # Результаты операций уже согласованы по размерностям, повторная проверка не нужна
+        obj = cls.__new__(cls)
+        if isinstance(flat, array):
+            buf = flat
+        else:
+            buf, dtype = _build_buffer(lambda: flat, dtype)
+        obj._init_flat(buf, rows, cols, dtype)
+        return obj
+
+    @property
+    def data(self):
+        flat = self.flat()
+        return [flat[i * self.cols:(i + 1) * self.cols] for i in range(self.rows)]
+
+    @property
+    def nbytes(self):
+        return _buffer_nbytes(self._buf)
+
+    @property
+    def shape(self):
+        return self.rows, self.cols
+
+    @property
+    def T(self):
+        return Matrix._from_flat(_transpose_flat(self._buf, self.rows, self.cols), self.cols, self.rows, self.dtype)
+
+    def row(self, i):
+        if not 0 <= i < self.rows:
+            raise IndexError("Индекс ряда вне диапазона")
+        return self._view[i * self.cols:(i + 1) * self.cols]
+
+    def flat(self):
+        return self._buf.tolist() if isinstance(self._buf, array) else list(self._buf)
+
     def __add__(self, other):
+        # Для других представлений (например, SparseMatrix из hw_3_third) срабатывает их __radd__
+        if not isinstance(other, Matrix):
+            return NotImplemented
         if self.rows != other.rows or self.cols != other.cols:
             raise ValueError("Размерности матриц не согласованы")
 
-        result = [
-            [self.data[i][j] + other.data[i][j] for j in range(self.cols)]
-            for i in range(self.rows)
-        ]
-        return Matrix(result)
+        result, dtype = _build_buffer(lambda: map(add, self._buf, other._buf), _result_dtype(self, other))
+        return Matrix._from_flat(result, self.rows, self.cols, dtype)
 
     def __mul__(self, other):
+        if not isinstance(other, Matrix):
+            return NotImplemented
         if self.rows != other.rows or self.cols != other.cols:
             raise ValueError("Размерности матриц не согласованы")
 
-        result = [
-            [self.data[i][j] * other.data[i][j] for j in range(self.cols)]
-            for i in range(self.rows)
-        ]
-        return Matrix(result)
+        result, dtype = _build_buffer(lambda: map(mul, self._buf, other._buf), _result_dtype(self, other))
+        return Matrix._from_flat(result, self.rows, self.cols, dtype)
 
-    def __matmul__(self, other):
+    def matmul(self, other, backend=None, n_jobs=1):
         if self.cols != other.rows:
             raise ValueError("Размерности матриц не согласованы")
 
-        result = [
-            [
-                sum(self.data[i][k] * other.data[k][j] for k in range(self.cols))
-                for j in range(other.cols)
-            ]
-            for i in range(self.rows)
-        ]
-        return Matrix(result)
+        name = backend or self.matmul_backend
+        if name not in MATMUL_BACKENDS:
+            raise ValueError(f"Неизвестный backend умножения: {name}")
+
+        n, m, p = self.rows, self.cols, other.cols
+        dtype = _result_dtype(self, other)
+        # Значения 'object' не лежат в плоском буфере фиксированной ширины, их в разделяемую память не передать
+        if n_jobs > 1 and n > 1 and n * m * p >= PARALLEL_MIN_OPS and DTYPES[dtype] is not None:
+            try:
+                return self._matmul_parallel(other, name, n_jobs, dtype)
+            except OverflowError:
+                # Результат не поместился в int64: считаем последовательно, _from_flat продвинет dtype
+                pass
+
+        flat = MATMUL_BACKENDS[name](self.flat(), other.flat(), n, m, p)
+        return Matrix._from_flat(flat, n, p, dtype)
+
+    def _matmul_parallel(self, other, backend, n_jobs, dtype):
+        n, m, p = self.rows, self.cols, other.cols
+        out_code = DTYPES[dtype]
+        out = array(out_code, bytes(n * p * array(out_code).itemsize))
+
+        shms = [_to_shared(self._buf), _to_shared(other._buf), _to_shared(out)]
+        a_shm, b_shm, out_shm = shms
+        typecodes = (self._buf.typecode, other._buf.typecode, out_code)
+        try:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = [
+                    executor.submit(
+                        _matmul_band, a_shm.name, b_shm.name, out_shm.name,
+                        typecodes, n, m, p, start, stop, backend
+                    )
+                    for start, stop in _row_bands(n, min(n_jobs, n))
+                ]
+                for future in futures:
+                    future.result()
+
+            out = array(out_code)
+            out.frombytes(out_shm.buf[:n * p * out.itemsize])
+        finally:
+            for shm in shms:
+                shm.close()
+                shm.unlink()
+
+        return Matrix._from_flat(out, n, p, dtype)
+
+    def __matmul__(self, other):
+        if not isinstance(other, Matrix):
+            return NotImplemented
+        return self.matmul(other)
+
+    def save_to_file(self, filename, fmt='text'):
+        if fmt == 'text':
+            with open(filename, 'w') as f:
+                f.write(str(self))
+            return
+        if fmt != 'coo':
+            raise ValueError(f"Неизвестный формат файла: {fmt}")
+
+        # Тот же формат, что у SparseMatrix: "rows cols nnz", затем по строке "i j value" на ненулевой элемент
+        nonzero = [(i, j, x) for i in range(self.rows) for j, x in enumerate(self.row(i)) if x]
+        with open(filename, 'w') as f:
+            f.write(f"{self.rows} {self.cols} {len(nonzero)}\n")
+            for i, j, value in nonzero:
+                f.write(f"{i} {j} {value}\n")
 
     def __str__(self):
-        return '\n'.join([' '.join(map(str, row)) for row in self.data])
+        return '\n'.join([' '.join(map(str, self.row(i))) for i in range(self.rows)])
+
+
+def benchmark_matmul(sizes=(32, 64, 128, 256), repeat=3):
+    results = []
+    for size in sizes:
+        a = Matrix(np.random.randint(0, 10, (size, size)).tolist())
+        b = Matrix(np.random.randint(0, 10, (size, size)).tolist())
+        expected = None
+
+        timings = {}
+        for name in MATMUL_BACKENDS:
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                result = a.matmul(b, backend=name)
+                best = min(best, time.perf_counter() - start)
+
+            if expected is None:
+                expected = result.data
+            elif result.data != expected:
+                raise RuntimeError(f"Backend {name} вернул неверный результат")
+            timings[name] = best
+
+        results.append((size, timings))
+    return results
+
+
+def benchmark_n_jobs(size=256, n_jobs_list=None, backend=None):
+    if n_jobs_list is None:
+        n_jobs_list = list(range(1, cpu_count() * 2 + 1))
+
+    a = Matrix(np.random.randint(0, 10, (size, size)).tolist())
+    b = Matrix(np.random.randint(0, 10, (size, size)).tolist())
+
+    results = []
+    for n_jobs in n_jobs_list:
+        start = time.perf_counter()
+        a.matmul(b, backend=backend, n_jobs=n_jobs)
+        results.append((n_jobs, time.perf_counter() - start))
+    return results
 
 
 if __name__ == '__main__':
@@ -71,4 +382,12 @@ if __name__ == '__main__':
     except ValueError as e:
         print(f"Error: {e}")
 
+    with open('matmul_benchmark.txt', 'w') as f:
+        f.write("size\t" + "\t".join(MATMUL_BACKENDS) + "\n")
+        for size, timings in benchmark_matmul():
+            f.write(f"{size}\t" + "\t".join(f"{timings[name]:.4f}" for name in MATMUL_BACKENDS) + "\n")
 
+    with open('matmul_n_jobs.txt', 'w') as f:
+        f.write("n_jobs\tProcessPoolExecutor\n")
+        for n_jobs, elapsed in benchmark_n_jobs():
+            f.write(f"{n_jobs}\t{elapsed:.4f}\n")
@@ -1,10 +1,227 @@
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import cpu_count, shared_memory
+
 import numpy as np
 from pathlib import Path
 
+# Ниже этого числа умножений (n * m * p) процессы не окупают запуск
+PARALLEL_MIN_OPS = 256 ** 3
+# Сколько рядов за раз копируется при бинарном сохранении
+SAVE_CHUNK_ROWS = 4096
+
+
+def _to_shared(arr):
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    shared = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+    shared[...] = arr
+    return shm, (shm.name, arr.shape, arr.dtype.str)
+
+
+def _attach(spec):
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _row_bands(rows, n_bands):
+    bounds = np.linspace(0, rows, n_bands + 1).astype(int)
+    return [(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+
+def _matmul_band(a_spec, b_spec, out_spec, start, stop):
+    a_shm, a = _attach(a_spec)
+    b_shm, b = _attach(b_spec)
+    out_shm, out = _attach(out_spec)
+    try:
+        np.matmul(a[start:stop], b, out=out[start:stop])
+    finally:
+        del a, b, out
+        a_shm.close()
+        b_shm.close()
+        out_shm.close()
+
+
+class _Leaf:
+    def __init__(self, array):
+        self.array = array
+        self.shape = array.shape
+        self.dtype = array.dtype
+
+
+class _Elementwise:
+    def __init__(self, ufunc, left, right):
+        self.ufunc = ufunc
+        self.left = left
+        self.right = right
+        right_shape = right.shape if isinstance(right, _NODES) else ()
+        self.shape = np.broadcast_shapes(left.shape, right_shape)
+        # Тип результата определяем пробным вызовом на одном элементе
+        right_probe = np.ones(1, right.dtype) if isinstance(right, _NODES) else right
+        self.dtype = ufunc(np.ones(1, left.dtype), right_probe).dtype
+
+
+class _MatMul:
+    def __init__(self, operands):
+        for left, right in zip(operands, operands[1:]):
+            if left.shape[1] != right.shape[0]:
+                raise ValueError("Размерности матриц не согласованы")
+        self.operands = operands
+        self.shape = (operands[0].shape[0], operands[-1].shape[1])
+        self.dtype = np.result_type(*[operand.dtype for operand in operands])
+
+
+_NODES = (_Leaf, _Elementwise, _MatMul)
+
+
+class _BufferPool:
+    def __init__(self):
+        self._free = {}
+
+    def get(self, shape, dtype):
+        buffers = self._free.get((shape, np.dtype(dtype)))
+        return buffers.pop() if buffers else np.empty(shape, dtype=dtype)
+
+    def put(self, buffer):
+        self._free.setdefault((buffer.shape, buffer.dtype), []).append(buffer)
+
+
+def _chain_order(dims):
+    count = len(dims) - 1
+    cost = [[0] * count for _ in range(count)]
+    split = [[0] * count for _ in range(count)]
+    for length in range(2, count + 1):
+        for i in range(count - length + 1):
+            j = i + length - 1
+            cost[i][j] = float('inf')
+            for k in range(i, j):
+                candidate = cost[i][k] + cost[k + 1][j] + dims[i] * dims[k + 1] * dims[j + 1]
+                if candidate < cost[i][j]:
+                    cost[i][j] = candidate
+                    split[i][j] = k
+    return split
+
+
+def _multiply_chain(arrays, split, i, j, out=None):
+    if i == j:
+        return arrays[i]
+    k = split[i][j]
+    left = _multiply_chain(arrays, split, i, k)
+    right = _multiply_chain(arrays, split, k + 1, j)
+    return np.matmul(left, right, out=out)
+
+
+def _operand(node, pool, taken):
+    if isinstance(node, _Leaf):
+        return node.array
+    buffer = pool.get(node.shape, node.dtype)
+    taken.append(buffer)
+    return _evaluate(node, buffer, pool)
+
+
+def _evaluate(node, out, pool):
+    if isinstance(node, _Leaf):
+        out[...] = node.array
+        return out
+
+    taken = []
+    if isinstance(node, _MatMul):
+        arrays = [_operand(operand, pool, taken) for operand in node.operands]
+        dims = [array.shape[0] for array in arrays] + [arrays[-1].shape[1]]
+        _multiply_chain(arrays, _chain_order(dims), 0, len(arrays) - 1, out=out)
+    else:
+        left = node.left
+        # Левая ветвь считается прямо в выходной буфер, временный нужен только правой
+        if not isinstance(left, _Leaf) and left.shape == out.shape and left.dtype == out.dtype:
+            left_value = _evaluate(left, out, pool)
+        else:
+            left_value = _operand(left, pool, taken)
+
+        right = node.right
+        right_value = _operand(right, pool, taken) if isinstance(right, _NODES) else right
+        node.ufunc(left_value, right_value, out=out)
+
+    for buffer in taken:
+        pool.put(buffer)
+    return out
+
+
+class LazyMatrix:
+    def __init__(self, node, matrix_cls):
+        self._node = node
+        self._matrix_cls = matrix_cls
+
+    @staticmethod
+    def _wrap(other):
+        if isinstance(other, LazyMatrix):
+            return other._node
+        return _Leaf(np.asarray(other.data))
+
+    def _elementwise(self, ufunc, other):
+        return LazyMatrix(_Elementwise(ufunc, self._node, other), self._matrix_cls)
+
+    @property
+    def shape(self):
+        return self._node.shape
+
+    @property
+    def data(self):
+        return self.evaluate().data
+
+    def evaluate(self):
+        out = np.empty(self._node.shape, dtype=self._node.dtype)
+        return self._matrix_cls(_evaluate(self._node, out, _BufferPool()))
+
+    def __add__(self, other):
+        return self._elementwise(np.add, self._wrap(other))
+
+    def __sub__(self, other):
+        return self._elementwise(np.subtract, self._wrap(other))
+
+    def __mul__(self, other):
+        return self._elementwise(np.multiply, self._wrap(other))
+
+    def __truediv__(self, other):
+        return self._elementwise(np.true_divide, self._wrap(other))
+
+    def __pow__(self, power):
+        return self._elementwise(np.power, power)
+
+    def __matmul__(self, other):
+        operands = []
+        for node in (self._node, self._wrap(other)):
+            operands.extend(node.operands if isinstance(node, _MatMul) else [node])
+        return LazyMatrix(_MatMul(operands), self._matrix_cls)
+
 
 class FileOperationsMixin:
-    def save_to_file(self, filename):
-        Path(filename).write_text(str(self))
+    def save_to_file(self, filename, fmt='text', chunk_rows=SAVE_CHUNK_ROWS):
+        if fmt == 'text':
+            Path(filename).write_text(str(self))
+            return
+        if fmt != 'binary':
+            raise ValueError(f"Неизвестный формат файла: {fmt}")
+
+        data = np.asanyarray(self.data)
+        if data.size == 0:
+            # np.save с именем файла дописывает .npy, через открытый файл имя остаётся как задано
+            with open(filename, 'wb') as f:
+                np.save(f, data, allow_pickle=False)
+            return
+
+        # Формат .npy: заголовок с dtype и shape, затем сырые данные без потери точности
+        out = np.lib.format.open_memmap(filename, mode='w+', dtype=data.dtype, shape=data.shape)
+        try:
+            for start in range(0, data.shape[0], chunk_rows):
+                out[start:start + chunk_rows] = data[start:start + chunk_rows]
+            out.flush()
+        finally:
+            del out
+
+    @classmethod
+    def load(cls, filename, mode='r'):
+        return cls(np.load(filename, mmap_mode=mode, allow_pickle=False))
 
 
 class PrintMixin:
@@ -19,30 +236,173 @@ class AccessorsMixin:
 
     @property
     def T(self):
-        return self.__class__(self.data.T)
+        return self.__class__(self.data.T, copy=False)
+
+
+class LazyMixin:
+    def lazy(self):
+        return LazyMatrix(_Leaf(self.data), self.__class__)
+
+
+class Matrix(FileOperationsMixin, PrintMixin, AccessorsMixin, LazyMixin):
+    def __init__(self, data, copy=False):
+        self.data = np.array(data) if copy else np.asanyarray(data)
+
+    def _binary(self, ufunc, other, out):
+        if out is None:
+            return self.__class__(ufunc(self.data, other.data))
+        ufunc(self.data, other.data, out=out.data)
+        return out
+
+    def add(self, other, out=None):
+        return self._binary(np.add, other, out)
+
+    def sub(self, other, out=None):
+        return self._binary(np.subtract, other, out)
 
+    def mul(self, other, out=None):
+        return self._binary(np.multiply, other, out)
 
-class Matrix(FileOperationsMixin, PrettyPrintMixin, AccessorsMixin):
-    def __init__(self, data):
-        self.data = np.array(data)
+    def truediv(self, other, out=None):
+        return self._binary(np.true_divide, other, out)
+
+    def pow(self, power, out=None):
+        if out is None:
+            return self.__class__(self.data ** power)
+        np.power(self.data, power, out=out.data)
+        return out
 
     def __add__(self, other):
-        return self.__class__(self.data + other.data)
+        return self.add(other)
 
     def __sub__(self, other):
-        return self.__class__(self.data - other.data)
+        return self.sub(other)
 
     def __mul__(self, other):
-        return self.__class__(self.data * other.data)
+        return self.mul(other)
+
+    def _inplace(self, method, other):
+        # Только для чтения (Matrix.load с mode='r') или результат шире self после broadcasting - новая матрица
+        operand = other.data if isinstance(other, Matrix) else other
+        if not self.data.flags.writeable or np.broadcast_shapes(self.data.shape, np.shape(operand)) != self.data.shape:
+            return method(other)
+        try:
+            return method(other, out=self)
+        except TypeError:
+            # Результат не приводится к dtype self (int += float, int /= int): как до in-place версий, новая матрица
+            return method(other)
+
+    def __iadd__(self, other):
+        return self._inplace(self.add, other)
+
+    def __isub__(self, other):
+        return self._inplace(self.sub, other)
+
+    def __imul__(self, other):
+        return self._inplace(self.mul, other)
+
+    def matmul(self, other, n_jobs=1, out=None):
+        # Параллельный путь делит на полосы только двумерные матрицы, остальное умножает numpy как есть
+        if n_jobs > 1 and self.data.ndim == other.data.ndim == 2:
+            n, m = self.data.shape
+            p = other.data.shape[1]
+            if n > 1 and n * m * p >= PARALLEL_MIN_OPS:
+                return self._matmul_parallel(other, n_jobs, out)
+        if out is None:
+            return self.__class__(self.data @ other.data)
+        np.matmul(self.data, other.data, out=out.data)
+        return out
+
+    def _matmul_parallel(self, other, n_jobs, out=None):
+        n, p = self.data.shape[0], other.data.shape[1]
+        dtype = np.result_type(self.data, other.data)
+
+        a_shm, a_spec = _to_shared(np.ascontiguousarray(self.data, dtype=dtype))
+        b_shm, b_spec = _to_shared(np.ascontiguousarray(other.data, dtype=dtype))
+        out_shm, out_spec = _to_shared(np.empty((n, p), dtype=dtype))
+        try:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = [
+                    executor.submit(_matmul_band, a_spec, b_spec, out_spec, start, stop)
+                    for start, stop in _row_bands(n, min(n_jobs, n))
+                ]
+                for future in futures:
+                    future.result()
+
+            result = np.ndarray((n, p), dtype=dtype, buffer=out_shm.buf)
+            if out is None:
+                out = self.__class__(result.copy())
+            else:
+                out.data[...] = result
+            del result
+        finally:
+            for shm in (a_shm, b_shm, out_shm):
+                shm.close()
+                shm.unlink()
+
+        return out
 
     def __matmul__(self, other):
-        return self.__class__(self.data @ other.data)
+        return self.matmul(other)
 
     def __truediv__(self, other):
-        return self.__class__(self.data / other.data)
+        return self.truediv(other)
 
     def __pow__(self, power):
-        return self.__class__(self.data ** power)
+        return self.pow(power)
+
+    def __itruediv__(self, other):
+        return self._inplace(self.truediv, other)
+
+    def __ipow__(self, power):
+        return self._inplace(self.pow, power)
+
+
+def benchmark_n_jobs(size=2048, n_jobs_list=None):
+    if n_jobs_list is None:
+        n_jobs_list = list(range(1, cpu_count() * 2 + 1))
+
+    a = Matrix(np.random.rand(size, size))
+    b = Matrix(np.random.rand(size, size))
+
+    results = []
+    for n_jobs in n_jobs_list:
+        start = time.perf_counter()
+        a.matmul(b, n_jobs=n_jobs)
+        results.append((n_jobs, time.perf_counter() - start))
+    return results
+
+
+def benchmark_lazy(size=2000, repeat=3):
+    a, b, c, d = (Matrix(np.random.rand(size, size)) for _ in range(4))
+    x = Matrix(np.random.rand(size, size // 100))
+    y = Matrix(np.random.rand(size // 100, size))
+    expressions = {
+        '(a + b) * c - d ** 2': (
+            lambda: (a + b) * c - d ** 2,
+            lambda: ((a.lazy() + b) * c - d.lazy() ** 2).evaluate(),
+        ),
+        'x @ y @ a': (
+            lambda: x @ y @ a,
+            lambda: (x.lazy() @ y @ a).evaluate(),
+        ),
+    }
+
+    results = []
+    for name, variants in expressions.items():
+        row = [name]
+        for run in variants:
+            best = float('inf')
+            for _ in range(repeat):
+                tracemalloc.start()
+                start = time.perf_counter()
+                run()
+                best = min(best, time.perf_counter() - start)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            row.extend([best, peak / 2 ** 20])
+        results.append(row)
+    return results
 
 
 if __name__ == '__main__':
@@ -53,3 +413,13 @@ if __name__ == '__main__':
     (m1 + m2).save_to_file('matrix_add_2.txt')
     (m1 * m2).save_to_file('matrix_multiply_2.txt')
     (m1 @ m2).save_to_file('matrix_math_multiply_2.txt')
+
+    with open('matmul_n_jobs_2.txt', 'w') as f:
+        f.write("n_jobs\tProcessPoolExecutor\n")
+        for n_jobs, elapsed in benchmark_n_jobs():
+            f.write(f"{n_jobs}\t{elapsed:.4f}\n")
+
+    with open('lazy_benchmark_2.txt', 'w') as f:
+        f.write("expression\teager_time\teager_peak_mb\tlazy_time\tlazy_peak_mb\n")
+        for name, eager_time, eager_peak, lazy_time, lazy_peak in benchmark_lazy():
+            f.write(f"{name}\t{eager_time:.4f}\t{eager_peak:.1f}\t{lazy_time:.4f}\t{lazy_peak:.1f}\n")
@@ -0,0 +1,247 @@
+import time
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+from hw_3_first import Matrix, _buffer_nbytes, _build_buffer, _infer_dtype, _result_dtype
+
+# Доля ненулевых элементов, ниже которой матрица хранится в CSR
+DENSITY_THRESHOLD = 0.05
+
+
+class SparseMatrix:
+    __slots__ = ('indptr', 'indices', 'values', 'rows', 'cols', 'dtype')
+
+    def __init__(self, indptr, indices, values, rows, cols, dtype):
+        self.indptr = indptr
+        self.indices = indices
+        self.values = values
+        self.rows = rows
+        self.cols = cols
+        self.dtype = dtype
+
+    @classmethod
+    def from_rows(cls, rows_data, cols, dtype=None):
+        # rows_data: по одному словарю {столбец: значение} на ряд
+        indptr = array('q', [0])
+        indices = array('q')
+        values = []
+        for row in rows_data:
+            for j in sorted(row):
+                value = row[j]
+                if value:
+                    indices.append(j)
+                    values.append(value)
+            indptr.append(len(indices))
+
+        if dtype is None:
+            dtype = _infer_dtype(values)
+        buf, dtype = _build_buffer(lambda: values, dtype)
+        return cls(indptr, indices, buf, len(indptr) - 1, cols, dtype)
+
+    @classmethod
+    def from_dense(cls, data, dtype=None):
+        if isinstance(data, Matrix):
+            data = data.data
+        rows = len(data)
+        cols = len(data[0]) if rows > 0 else 0
+
+        rows_data = []
+        for row in data:
+            if len(row) != cols:
+                raise ValueError("Длина рядов должна совпадать")
+            rows_data.append({j: value for j, value in enumerate(row) if value})
+        return cls.from_rows(rows_data, cols, dtype)
+
+    @property
+    def shape(self):
+        return self.rows, self.cols
+
+    @property
+    def nnz(self):
+        return len(self.values)
+
+    @property
+    def density(self):
+        size = self.rows * self.cols
+        return self.nnz / size if size else 0.0
+
+    @property
+    def nbytes(self):
+        return sum(_buffer_nbytes(buf) for buf in (self.indptr, self.indices, self.values))
+
+    @property
+    def data(self):
+        return [self._dense_row(i) for i in range(self.rows)]
+
+    def row(self, i):
+        start, stop = self.indptr[i], self.indptr[i + 1]
+        return dict(zip(self.indices[start:stop], self.values[start:stop]))
+
+    def _dense_row(self, i):
+        result = [0.0] * self.cols if self.dtype == 'float64' else [0] * self.cols
+        for j, value in self.row(i).items():
+            result[j] = value
+        return result
+
+    def flat(self):
+        return [x for i in range(self.rows) for x in self._dense_row(i)]
+
+    def to_dense(self):
+        return Matrix._from_flat(self.flat(), self.rows, self.cols, self.dtype)
+
+    def _check_same_shape(self, other):
+        if self.rows != other.rows or self.cols != other.cols:
+            raise ValueError("Размерности матриц не согласованы")
+
+    def _finalize(self, result):
+        # Плотный hw_3_first.Matrix поддерживает те же +, *, @, T, shape и save_to_file
+        return result.to_dense() if result.density > DENSITY_THRESHOLD else result
+
+    def __add__(self, other):
+        self._check_same_shape(other)
+        if not isinstance(other, SparseMatrix):
+            return self.to_dense() + other
+
+        rows_data = []
+        for i in range(self.rows):
+            row = self.row(i)
+            for j, value in other.row(i).items():
+                row[j] = row.get(j, 0) + value
+            rows_data.append(row)
+        return self._finalize(SparseMatrix.from_rows(rows_data, self.cols, _result_dtype(self, other)))
+
+    # Сложение и поэлементное умножение коммутативны, поэтому плотный операнд слева обрабатывается так же
+    def __radd__(self, other):
+        return self + other
+
+    def __rmul__(self, other):
+        return self * other
+
+    def __mul__(self, other):
+        self._check_same_shape(other)
+        is_sparse = isinstance(other, SparseMatrix)
+
+        rows_data = []
+        for i in range(self.rows):
+            other_row = other.row(i)
+            if is_sparse:
+                row = {j: value * other_row[j] for j, value in self.row(i).items() if j in other_row}
+            else:
+                row = {j: value * other_row[j] for j, value in self.row(i).items()}
+            rows_data.append(row)
+        return SparseMatrix.from_rows(rows_data, self.cols, _result_dtype(self, other))
+
+    def __matmul__(self, other):
+        if self.cols != other.rows:
+            raise ValueError("Размерности матриц не согласованы")
+        if isinstance(other, SparseMatrix):
+            return self._matmul_sparse(other)
+        return self._matmul_dense(other)
+
+    def __rmatmul__(self, other):
+        # dense @ sparse = (sparse.T @ dense.T).T, проход только по ненулевым элементам
+        if other.cols != self.rows:
+            raise ValueError("Размерности матриц не согласованы")
+        return (self.T @ other.T).T
+
+    def _matmul_sparse(self, other):
+        # Алгоритм Густавсона: ряд результата накапливается из рядов other
+        other_rows = [other.row(k) for k in range(other.rows)]
+        rows_data = []
+        for i in range(self.rows):
+            acc = {}
+            for k, a_ik in self.row(i).items():
+                for j, b_kj in other_rows[k].items():
+                    acc[j] = acc.get(j, 0) + a_ik * b_kj
+            rows_data.append(acc)
+        result = SparseMatrix.from_rows(rows_data, other.cols, _result_dtype(self, other))
+        return self._finalize(result)
+
+    def _matmul_dense(self, other):
+        p = other.cols
+        b_rows = [list(other.row(k)) for k in range(other.rows)]
+        zero = [0] * p
+
+        result = []
+        for i in range(self.rows):
+            c_row = zero
+            for k, a_ik in self.row(i).items():
+                c_row = [c + a_ik * b_kj for c, b_kj in zip(c_row, b_rows[k])]
+            result.extend(c_row)
+        return Matrix._from_flat(result, self.rows, p, _result_dtype(self, other))
+
+    @property
+    def T(self):
+        counts = [0] * (self.cols + 1)
+        for j in self.indices:
+            counts[j + 1] += 1
+        for j in range(self.cols):
+            counts[j + 1] += counts[j]
+
+        indptr = array('q', counts)
+        indices = array('q', bytes(self.nnz * indptr.itemsize))
+        values = self.values[:]  # тот же тип буфера и длина, значения перезаписываются ниже
+        position = counts[:-1]
+        for i in range(self.rows):
+            for idx in range(self.indptr[i], self.indptr[i + 1]):
+                j = self.indices[idx]
+                dest = position[j]
+                indices[dest] = i
+                values[dest] = self.values[idx]
+                position[j] += 1
+        return SparseMatrix(indptr, indices, values, self.cols, self.rows, self.dtype)
+
+    def save_to_file(self, filename, fmt='text'):
+        if fmt == 'text':
+            Path(filename).write_text(str(self))
+            return
+        if fmt != 'coo':
+            raise ValueError(f"Неизвестный формат файла: {fmt}")
+
+        with open(filename, 'w') as f:
+            f.write(f"{self.rows} {self.cols} {self.nnz}\n")
+            for i in range(self.rows):
+                for j, value in self.row(i).items():
+                    f.write(f"{i} {j} {value}\n")
+
+    def __str__(self):
+        return '\n'.join([' '.join(map(str, self._dense_row(i))) for i in range(self.rows)])
+
+
+def as_matrix(data, density_threshold=DENSITY_THRESHOLD):
+    rows = len(data)
+    cols = len(data[0]) if rows > 0 else 0
+    nonzero = sum(1 for row in data for value in row if value)
+    if rows * cols and nonzero / (rows * cols) <= density_threshold:
+        return SparseMatrix.from_dense(data)
+    return Matrix(data)
+
+
+def benchmark_sparse(sizes=(100, 200, 400), density=0.01, repeat=3):
+    results = []
+    for size in sizes:
+        mask = np.random.rand(size, size) < density
+        data = (np.random.randint(1, 10, (size, size)) * mask).tolist()
+        dense = Matrix(data)
+        sparse = SparseMatrix.from_dense(data)
+
+        timings = []
+        for left, right in ((dense, dense), (sparse, dense), (sparse, sparse)):
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                left @ right
+                best = min(best, time.perf_counter() - start)
+            timings.append(best)
+        results.append((size, dense.nbytes, sparse.nbytes, *timings))
+    return results
+
+
+if __name__ == '__main__':
+    np.random.seed(0)
+    with open('sparse_benchmark.txt', 'w') as f:
+        f.write("size\tdense_bytes\tsparse_bytes\tdense@dense\tsparse@dense\tsparse@sparse\n")
+        for size, dense_bytes, sparse_bytes, dd, sd, ss in benchmark_sparse():
+            f.write(f"{size}\t{dense_bytes}\t{sparse_bytes}\t{dd:.4f}\t{sd:.4f}\t{ss:.4f}\n")
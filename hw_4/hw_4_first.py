@@ -1,6 +1,16 @@
 import time
+import statistics
 import threading
 import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import lru_cache
+
+FIB_CACHE_SIZE = 4096
+FIB_MEMO_STEP = 256
+START_METHODS = [
+    method for method in ('fork', 'spawn', 'forkserver')
+    if method in multiprocessing.get_all_start_methods()
+]
 
 def fib(n):
     if n <= 1:
@@ -8,46 +18,147 @@ def fib(n):
     else:
         return fib(n - 1) + fib(n - 2)
 
-def run_sync(n, times=10):
-    start = time.time()
+@lru_cache(maxsize=FIB_CACHE_SIZE)
+def _fib_cached(n):
+    if n <= 1:
+        return n
+    return _fib_cached(n - 1) + _fib_cached(n - 2)
+
+def fib_memo(n):
+    # Заполняем кэш ступенями снизу вверх, чтобы глубина рекурсии не превышала FIB_MEMO_STEP
+    for k in range(FIB_MEMO_STEP, n, FIB_MEMO_STEP):
+        _fib_cached(k)
+    return _fib_cached(n)
+
+def fib_iter(n):
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return a
+
+def fib_doubling(n):
+    # F(2k) = F(k) * (2F(k+1) - F(k)), F(2k+1) = F(k)^2 + F(k+1)^2
+    a, b = 0, 1
+    for bit in bin(n)[2:]:
+        a, b = a * (2 * b - a), a * a + b * b
+        if bit == '1':
+            a, b = b, a + b
+    return a
+
+FIB_STRATEGIES = {
+    'naive': fib,
+    'memo': fib_memo,
+    'iter': fib_iter,
+    'doubling': fib_doubling,
+}
+
+def fib_task(n, strategy='naive'):
+    # Стратегия передаётся по имени: так задача одинаково работает и в потоках, и в процессах,
+    # а кэш fib_memo общий для всех потоков процесса и наследуется дочерними процессами при fork.
+    # Для n < 0 стратегии дают разные ответы (fib возвращает n, fib_doubling разбирает '-0b...'), поэтому отсекаем заранее
+    if n < 0:
+        raise ValueError(f"n должно быть неотрицательным, получено {n}")
+    return FIB_STRATEGIES[strategy](n)
+
+def run_sync(n, times=10, strategy='naive'):
+    start = time.perf_counter()
     for _ in range(times):
-        fib(n)
-    end = time.time()
+        fib_task(n, strategy)
+    end = time.perf_counter()
     return end - start
 
-def run_threads(n, times=10):
+def run_threads(n, times=10, strategy='naive'):
     threads = []
-    start = time.time()
+    start = time.perf_counter()
     for _ in range(times):
-        thread = threading.Thread(target=fib, args=(n,))
+        thread = threading.Thread(target=fib_task, args=(n, strategy))
         thread.start()
         threads.append(thread)
     for thread in threads:
         thread.join()
-    end = time.time()
+    end = time.perf_counter()
     return end - start
 
-def run_processes(n, times=10):
+def run_processes(n, times=10, strategy='naive'):
     processes = []
-    start = time.time()
+    start = time.perf_counter()
     for _ in range(times):
-        process = multiprocessing.Process(target=fib, args=(n,))
+        process = multiprocessing.Process(target=fib_task, args=(n, strategy))
         process.start()
         processes.append(process)
     for process in processes:
         process.join()
-    end = time.time()
+    end = time.perf_counter()
     return end - start
 
+def summarize(samples):
+    if len(samples) > 1:
+        percentiles = statistics.quantiles(samples, n=100, method='inclusive')
+    else:
+        percentiles = samples * 99
+    return {
+        'median': statistics.median(samples),
+        'p90': percentiles[89],
+        'p99': percentiles[98],
+        'min': min(samples),
+    }
+
+def run_pool(executor, n, times=10, strategy='naive'):
+    start = time.perf_counter()
+    results = list(executor.map(fib_task, [n] * times, [strategy] * times))
+    end = time.perf_counter()
+    return results, end - start
+
+def benchmark_sync(n, times=10, strategy='naive', trials=5):
+    samples = [run_sync(n, times, strategy) for _ in range(trials)]
+    return [fib_task(n, strategy)] * times, summarize(samples)
+
+def benchmark_pool(executor, n, times=10, strategy='naive', trials=5):
+    # Прогрев: поднимаем воркеров и импортируем модуль в них до начала замеров
+    list(executor.map(fib_task, [0] * times))
+
+    samples = []
+    for _ in range(trials):
+        results, elapsed = run_pool(executor, n, times, strategy)
+        samples.append(elapsed)
+    return results, summarize(samples)
+
+def benchmark_runners(n, times=10, strategy='naive', trials=5, workers=None):
+    workers = workers or times
+    runners = {'sync': None, 'thread_pool': ThreadPoolExecutor(max_workers=workers)}
+    for method in START_METHODS:
+        context = multiprocessing.get_context(method)
+        runners[f'process_pool[{method}]'] = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+    report = {}
+    for name, executor in runners.items():
+        if executor is None:
+            report[name] = benchmark_sync(n, times, strategy, trials)[1]
+            continue
+        with executor:
+            report[name] = benchmark_pool(executor, n, times, strategy, trials)[1]
+    return report
+
 if __name__ == "__main__":
     n = 35
     times = 10
 
-    sync_time = run_sync(n, times)
-    threads_time = run_threads(n, times)
-    processes_time = run_processes(n, times)
-
     with open("fibonacci.txt", "w") as f:
-        f.write(f"Синхронный запуск (10 раз): {sync_time:.2f} сек\n")
-        f.write(f"Запуск в 10 потоках: {threads_time:.2f} сек\n")
-        f.write(f"Запуск в 10 процессах: {processes_time:.2f} сек\n")
\ No newline at end of file
+        for strategy in FIB_STRATEGIES:
+            sync_time = run_sync(n, times, strategy)
+            threads_time = run_threads(n, times, strategy)
+            processes_time = run_processes(n, times, strategy)
+
+            f.write(f"[{strategy}] Синхронный запуск (10 раз): {sync_time:.6f} сек\n")
+            f.write(f"[{strategy}] Запуск в 10 потоках: {threads_time:.6f} сек\n")
+            f.write(f"[{strategy}] Запуск в 10 процессах: {processes_time:.6f} сек\n")
+
+    report = benchmark_runners(n, times)
+    baseline = report['sync']['median']
+    with open("fibonacci_pools.txt", "w") as f:
+        f.write("runner\tmedian\tp90\tp99\tspeedup\n")
+        for name, stats in report.items():
+            f.write(
+                f"{name}\t{stats['median']:.4f}\t{stats['p90']:.4f}\t{stats['p99']:.4f}\t"
+                f"{baseline / stats['median']:.2f}\n"
+            )
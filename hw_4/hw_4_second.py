@@ -1,31 +1,249 @@
+import atexit
+import heapq
 import math
+import os
 import time
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from multiprocessing import cpu_count
 from functools import partial
+from itertools import islice
 
-def compute_part(f, a, step, start, partial_iter):
-    local_a = a + start * step
-    local_b = local_a + partial_iter * step
+import numpy as np
+
+RULES = ('left', 'trapezoid', 'simpson')
+# Сколько точек сетки векторизованный режим вычисляет за один раз
+VECTOR_CHUNK = 1 << 16
+# На сколько кусков в среднем делится работа одного воркера
+CHUNKS_PER_JOB = 8
+
+# Узлы и веса правила Гаусса-Кронрода G7-K15 на [-1, 1]; узлы с нечётным индексом общие с G7
+GK15_NODES = (
+    0.991455371120812639206854697526329,
+    0.949107912342758524526189684047851,
+    0.864864423359769072789712788640926,
+    0.741531185599394439863864773280788,
+    0.586087235467691130294144845693013,
+    0.405845151377397166906606412076961,
+    0.207784955007898467600689403773245,
+    0.000000000000000000000000000000000,
+)
+GK15_WEIGHTS = (
+    0.022935322010529224963732008058970,
+    0.063092092629978553290700663189204,
+    0.104790010322250183839876322541518,
+    0.140653259715525918745189590510238,
+    0.169004726639267902826583426598550,
+    0.190350578064785409913256402421014,
+    0.204432940075298892414161999234649,
+    0.209482141084727828012999174891714,
+)
+G7_WEIGHTS = (
+    0.129484966168869693270611432679082,
+    0.279705391489276667901467771423780,
+    0.381830050505118944950369775488975,
+    0.417959183673469387755102040816327,
+)
+
+def _sum_points(f, a, step, start, stop, stride=1):
+    acc = 0
+    for i in range(start, stop, stride):
+        acc += f(a + i * step)
+    return acc
+
+def _weights(idx, n_iter, rule):
+    if rule == 'left':
+        return np.ones(len(idx))
+    if rule == 'trapezoid':
+        w = np.ones(len(idx))
+        w[(idx == 0) | (idx == n_iter)] = 0.5
+        return w
+    w = np.where(idx % 2 == 1, 4 / 3, 2 / 3)
+    w[(idx == 0) | (idx == n_iter)] = 1 / 3
+    return w
+
+def _points_count(n_iter, rule):
+    # Левые прямоугольники не используют правый конец отрезка
+    return n_iter if rule == 'left' else n_iter + 1
+
+def compute_part(f, a, step, start, partial_iter, n_iter=None, rule='left'):
+    n_iter = n_iter if n_iter is not None else start + partial_iter
+    stop = min(start + partial_iter, _points_count(n_iter, rule))
+    if rule == 'left':
+        return _sum_points(f, a, step, start, stop) * step
+
+    # Веса не вычисляются для каждой точки: концы отрезка учитываются отдельно,
+    # внутренние точки Симпсона суммируются через одну, отдельно нечётные (4/3) и чётные (2/3)
     acc = 0
-    for i in range(partial_iter):
-        x = local_a + i * step
-        acc += f(x) * step
+    edge_weight = 0.5 if rule == 'trapezoid' else 1 / 3
+    for i in {0, n_iter}:
+        if start <= i < stop:
+            acc += f(a + i * step) * edge_weight
+    inner_start, inner_stop = max(start, 1), min(stop, n_iter)
+    if rule == 'trapezoid':
+        acc += _sum_points(f, a, step, inner_start, inner_stop)
+    else:
+        odd_start = inner_start | 1
+        even_start = inner_start + (inner_start & 1)
+        acc += _sum_points(f, a, step, odd_start, inner_stop, 2) * (4 / 3)
+        acc += _sum_points(f, a, step, even_start, inner_stop, 2) * (2 / 3)
+    return acc * step
+
+def compute_part_vectorized(f, a, step, start, partial_iter, n_iter=None, rule='left', chunk_size=VECTOR_CHUNK):
+    n_iter = n_iter if n_iter is not None else start + partial_iter
+    stop = min(start + partial_iter, _points_count(n_iter, rule))
+    acc = 0.0
+    for block_start in range(start, stop, chunk_size):
+        block_stop = min(block_start + chunk_size, stop)
+        idx = np.arange(block_start, block_stop)
+        x = np.linspace(a + block_start * step, a + (block_stop - 1) * step, block_stop - block_start)
+        acc += float(np.dot(_weights(idx, n_iter, rule), f(x))) * step
     return acc
 
-def integrate(f, a, b, *, n_jobs=1, n_iter=10000000):
+# Общий пул процессов переживает вызовы integrate и пересоздаётся при смене n_jobs или функции
+_executor = None
+_executor_config = None
+_worker_f = None
+
+def _init_worker(f):
+    # Функция передаётся воркеру один раз при старте, а не с каждой задачей
+    global _worker_f
+    _worker_f = f
+
+def _compute_part_initialized(a, step, start, partial_iter, n_iter=None, rule='left', vectorized=False):
+    compute = compute_part_vectorized if vectorized else compute_part
+    return compute(_worker_f, a, step, start, partial_iter, n_iter, rule)
+
+def _gauss_kronrod_initialized(a, b):
+    return gauss_kronrod(_worker_f, a, b)
+
+def get_executor(n_jobs, f):
+    global _executor, _executor_config
+    if _executor is not None and _executor_config == (n_jobs, f):
+        return _executor
+
+    shutdown_executor()
+    _executor = ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(f,))
+    _executor_config = (n_jobs, f)
+    return _executor
+
+def start_executor(n_jobs, f):
+    start = time.perf_counter()
+    executor = get_executor(n_jobs, f)
+    # Дожидаемся запуска всех воркеров, чтобы время старта не попало в замер вычислений
+    wait([executor.submit(os.getpid) for _ in range(n_jobs)])
+    return time.perf_counter() - start
+
+def shutdown_executor():
+    global _executor, _executor_config
+    if _executor is not None:
+        _executor.shutdown()
+    _executor = None
+    _executor_config = None
+
+atexit.register(shutdown_executor)
+
+def _chunks(points, chunk_size):
+    for start in range(0, points, chunk_size):
+        yield start, min(start + chunk_size, points) - start
+
+def _run_chunks(executor, worker, points, chunk_size, n_jobs):
+    # В работе держим не больше двух кусков на воркер, следующий отдаём тому, кто освободился
+    chunks = _chunks(points, chunk_size)
+    pending = {executor.submit(worker, start, size) for start, size in islice(chunks, 2 * n_jobs)}
+    parts = []
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            parts.append(future.result())
+        for start, size in islice(chunks, len(done)):
+            pending.add(executor.submit(worker, start, size))
+    return math.fsum(parts)
+
+def integrate(f, a, b, *, n_jobs=1, n_iter=10000000, rule='left', vectorized=False, executor_cls=None,
+              chunk_size=None, persistent=True):
+    if rule not in RULES:
+        raise ValueError(f"Неизвестное правило интегрирования: {rule}")
+    if rule == 'simpson' and n_iter % 2:
+        raise ValueError("Для правила Симпсона n_iter должно быть чётным")
+
     step = (b - a) / n_iter
-    partial_iter = n_iter // n_jobs
+    points = _points_count(n_iter, rule)
+    if chunk_size is None:
+        chunk_size = max(1, math.ceil(points / (n_jobs * CHUNKS_PER_JOB)))
+
+    if executor_cls is None:
+        executor_cls = ThreadPoolExecutor if n_jobs == 1 else ProcessPoolExecutor
 
-    worker = partial(compute_part, f, a, step, partial_iter=partial_iter)
+    if executor_cls is ProcessPoolExecutor and persistent:
+        worker = partial(_compute_part_initialized, a, step, n_iter=n_iter, rule=rule, vectorized=vectorized)
+        try:
+            return _run_chunks(get_executor(n_jobs, f), worker, points, chunk_size, n_jobs)
+        except BrokenProcessPool:
+            shutdown_executor()
+            raise
+
+    compute = compute_part_vectorized if vectorized else compute_part
+    worker = partial(compute, f, a, step, n_iter=n_iter, rule=rule)
+    with executor_cls(max_workers=n_jobs) as executor:
+        return _run_chunks(executor, worker, points, chunk_size, n_jobs)
+
+def benchmark_chunks(f, a, b, *, chunk_sizes, n_jobs_list, n_iter=10000000, **kwargs):
+    results = []
+    for n_jobs in n_jobs_list:
+        timings = []
+        for chunk_size in chunk_sizes:
+            start = time.perf_counter()
+            integrate(f, a, b, n_jobs=n_jobs, n_iter=n_iter, chunk_size=chunk_size, **kwargs)
+            timings.append(time.perf_counter() - start)
+        results.append((n_jobs, timings))
+    return results
 
-    with (ThreadPoolExecutor if n_jobs == 1 else ProcessPoolExecutor)(max_workers=n_jobs) as executor:
-        futures = []
-        for start in range(0, n_iter, partial_iter):
-            futures.append(executor.submit(worker, start))
-        total = sum(f.result() for f in futures)
+def gauss_kronrod(f, a, b):
+    center = (a + b) / 2
+    half = (b - a) / 2
+    f_center = f(center)
+    kronrod = f_center * GK15_WEIGHTS[7]
+    gauss = f_center * G7_WEIGHTS[3]
+    for j in range(7):
+        dx = half * GK15_NODES[j]
+        pair = f(center - dx) + f(center + dx)
+        kronrod += GK15_WEIGHTS[j] * pair
+        if j % 2:
+            gauss += G7_WEIGHTS[j // 2] * pair
+    return kronrod * half, abs((kronrod - gauss) * half)
 
-    return total
+def integrate_adaptive(f, a, b, *, tol=1e-10, n_jobs=1, max_intervals=100000):
+    # Очередь отрезков упорядочена по оценке ошибки: на каждом шаге делятся n_jobs худших
+    bounds = np.linspace(a, b, n_jobs + 1).tolist()
+    if n_jobs > 1:
+        evaluate = _gauss_kronrod_initialized
+        run = get_executor(n_jobs, f).map
+    else:
+        evaluate = partial(gauss_kronrod, f)
+        run = map
+
+    heap = []
+    for left, right, (value, error) in zip(bounds[:-1], bounds[1:], run(evaluate, bounds[:-1], bounds[1:])):
+        heapq.heappush(heap, (-error, left, right, value))
+    total_error = sum(-item[0] for item in heap)
+
+    while total_error > tol and len(heap) < max_intervals:
+        worst = [heapq.heappop(heap) for _ in range(min(n_jobs, len(heap)))]
+        lefts, rights = [], []
+        for neg_error, left, right, _ in worst:
+            total_error += neg_error
+            middle = (left + right) / 2
+            lefts += [left, middle]
+            rights += [middle, right]
+
+        for left, right, (value, error) in zip(lefts, rights, run(evaluate, lefts, rights)):
+            heapq.heappush(heap, (-error, left, right, value))
+            total_error += error
+
+    value = math.fsum(item[3] for item in heap)
+    error = math.fsum(-item[0] for item in heap)
+    return value, error
 
 if __name__ == "__main__":
     cpu_num = cpu_count()
@@ -34,16 +252,41 @@ if __name__ == "__main__":
 
     for n_jobs in n_jobs_list:
         start = time.time()
-        integrate(math.cos, 0, math.pi / 2, n_jobs=n_jobs)
+        integrate(math.cos, 0, math.pi / 2, n_jobs=n_jobs, executor_cls=ThreadPoolExecutor)
         thread_time = time.time() - start
 
+        startup_time = start_executor(n_jobs, math.cos)
         start = time.time()
-        integrate(math.cos, 0, math.pi / 2, n_jobs=n_jobs)
+        integrate(math.cos, 0, math.pi / 2, n_jobs=n_jobs, executor_cls=ProcessPoolExecutor)
         process_time = time.time() - start
 
-        results.append((n_jobs, thread_time, process_time))
+        start_executor(n_jobs, np.cos)
+        start = time.time()
+        integrate(np.cos, 0, math.pi / 2, n_jobs=n_jobs, vectorized=True, executor_cls=ProcessPoolExecutor)
+        vectorized_time = time.time() - start
+
+        results.append((n_jobs, thread_time, startup_time, process_time, vectorized_time))
 
     with open("integrate.txt", "w") as f:
-        f.write("n_jobs\tThreadPoolExecutor\tProcessPoolExecutor\n")
-        for n_jobs, thread_time, process_time in results:
-            f.write(f"{n_jobs}\t{thread_time:.4f}\t\t\t{process_time:.4f}\n")
\ No newline at end of file
+        f.write("n_jobs\tThreadPoolExecutor\tProcessPool startup\tProcessPoolExecutor\tProcessPoolExecutor+NumPy\n")
+        for n_jobs, thread_time, startup_time, process_time, vectorized_time in results:
+            f.write(
+                f"{n_jobs}\t{thread_time:.4f}\t\t\t{startup_time:.4f}\t\t\t{process_time:.4f}"
+                f"\t\t\t{vectorized_time:.4f}\n"
+            )
+
+    with open("integrate_adaptive.txt", "w") as f:
+        f.write("n_jobs\tvalue\terror\ttime\n")
+        for n_jobs in (1, cpu_num):
+            start = time.time()
+            value, error = integrate_adaptive(math.cos, 0, math.pi / 2, tol=1e-12, n_jobs=n_jobs)
+            f.write(f"{n_jobs}\t{value:.15f}\t{error:.2e}\t{time.time() - start:.4f}\n")
+
+    chunk_sizes = [10 ** k for k in range(3, 8)]
+    with open("integrate_chunks.txt", "w") as f:
+        f.write("n_jobs\t" + "\t".join(f"chunk={size}" for size in chunk_sizes) + "\n")
+        for n_jobs, timings in benchmark_chunks(
+            math.cos, 0, math.pi / 2, chunk_sizes=chunk_sizes, n_jobs_list=n_jobs_list,
+            executor_cls=ProcessPoolExecutor
+        ):
+            f.write(f"{n_jobs}\t" + "\t".join(f"{timing:.4f}" for timing in timings) + "\n")
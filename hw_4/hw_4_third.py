@@ -1,105 +1,703 @@
+import json
 import multiprocessing
+import os
+import queue
+import statistics
+import struct
+import tempfile
 import time
 import threading
 import codecs
 from datetime import datetime
 
+from shm_ring import RingBuffer
+
+STOP = None  # Сигнал завершения, проходит по цепочке main -> A -> B -> main
+GET_TIMEOUT = 1
+A_DELAY = 5
+DRAIN_TIMEOUT = 30
+LOG_BATCH_SIZE = 256
+LOG_FLUSH_INTERVAL = 0.5
+PIPELINE_QUEUE_SIZE = 1024
+STAGE_STOP = -1  # Внутренний сигнал воркерам одной стадии: вход исчерпан
+# Замеры пишут тысячи строк лога, поэтому по умолчанию они уходят во временную папку, а не в рабочую
+BENCH_LOG_FILE = os.path.join(tempfile.gettempdir(), 'log_bench.txt')
+
 
 def log_entry(message, log_file):
     with open(log_file, 'a') as f:
         f.write(message + '\n')
 
 
-def process_a(queue_ab, pipe_ab, exit_event, log_file):
-    while not exit_event.is_set():
-        if not queue_ab.empty():
-            message = queue_ab.get()
-            timestamp = datetime.now().strftime('%H:%M:%S')
-            if message == "exit":
-                log_entry(f"[A][{timestamp}] exit", log_file)
-                exit_event.set()
+class QueueLogger:
+    # Стадии только кладут записи в очередь, в файл пишет один процесс log_writer
+    def __init__(self, log_queue, stage):
+        self.log_queue = log_queue
+        self.stage = stage
+
+    def __call__(self, message):
+        self.log_queue.put((time.perf_counter_ns(), self.stage, message))
+
+
+def log_writer(log_queue, log_file, start_ns, batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_INTERVAL):
+    def flush(batch):
+        # Внутри пачки восстанавливаем порядок по монотонным меткам времени
+        batch.sort(key=lambda record: record[0])
+        f.writelines(f"[{stage}][{(ns - start_ns) / 1e9:.6f}] {message}\n" for ns, stage, message in batch)
+        f.flush()
+        batch.clear()
+
+    batch = []
+    deadline = time.monotonic() + flush_interval
+    with open(log_file, 'a') as f:
+        while True:
+            try:
+                record = log_queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                # main завершился, не прислав STOP: дописываем накопленное и выходим, как и стадии
+                if not parent_alive():
+                    flush(batch)
+                    break
+                record = ()
+
+            if record is STOP:
+                flush(batch)
                 break
+            if record:
+                batch.append(record)
+            if len(batch) >= batch_size or time.monotonic() >= deadline:
+                if batch:
+                    flush(batch)
+                deadline = time.monotonic() + flush_interval
+
+
+def start_log_writer(log_file, **kwargs):
+    log_queue = multiprocessing.Queue()
+    writer = multiprocessing.Process(
+        target=log_writer,
+        args=(log_queue, log_file, time.perf_counter_ns()),
+        kwargs=kwargs
+    )
+    writer.start()
+    return log_queue, writer
+
+
+def stop_log_writer(log_queue, writer):
+    log_queue.put(STOP)
+    writer.join()
+
+
+def now():
+    return datetime.now().strftime('%H:%M:%S')
+
+
+def lowercase(message):
+    return message.lower()
+
+
+def rot13(message):
+    return codecs.encode(message, 'rot13')
+
+
+def parent_alive():
+    parent = multiprocessing.parent_process()
+    return parent is None or parent.is_alive()
+
+
+# Отметки цепочки main -> A -> B -> main; в бинарном виде хоп хранится индексом в этом кортеже
+HOPS = (
+    'main.enqueue', 'A.dequeue', 'A.processed', 'A.forward',
+    'B.dequeue', 'B.processed', 'B.forward', 'main.dequeue',
+)
+_HOP_CODES = {hop: code for code, hop in enumerate(HOPS)}
+_ENVELOPE_HEADER = struct.Struct('<QB')  # id и число отметок
+_STAMP = struct.Struct('<BQ')  # код хопа и perf_counter_ns
+
+
+class Envelope:
+    # Сообщение с идентификатором и отметками perf_counter_ns на каждом переходе
+    __slots__ = ('id', 'text', 'stamps')
+
+    def __init__(self, message_id, text):
+        self.id = message_id
+        self.text = text
+        self.stamps = []
+
+    def stamp(self, hop):
+        self.stamps.append((hop, time.perf_counter_ns()))
+
+    def pack(self):
+        # Заголовок фиксированного размера, отметки и текст в UTF-8 - без pickle
+        stamps = b''.join(_STAMP.pack(_HOP_CODES[hop], ns) for hop, ns in self.stamps)
+        return _ENVELOPE_HEADER.pack(self.id, len(self.stamps)) + stamps + self.text.encode()
+
+    @classmethod
+    def unpack(cls, data):
+        message_id, n_stamps = _ENVELOPE_HEADER.unpack_from(data)
+        stamps_end = _ENVELOPE_HEADER.size + n_stamps * _STAMP.size
+        envelope = cls(message_id, bytes(data[stamps_end:]).decode())
+        envelope.stamps = [(HOPS[code], ns) for code, ns in _STAMP.iter_unpack(data[_ENVELOPE_HEADER.size:stamps_end])]
+        return envelope
+
+
+class EnvelopeRing(RingBuffer):
+    # Кольцевой буфер, передающий Envelope как bytes: запись идёт по пути без pickle
+    def put(self, obj):
+        super().put(obj.pack() if isinstance(obj, Envelope) else obj)
+
+    def get(self, timeout=None):
+        obj = super().get(timeout)
+        return Envelope.unpack(obj) if isinstance(obj, bytes) else obj
 
-            log_entry(f"[A][{timestamp}] delivered: {message}", log_file)
-            processed_message = message.lower()
-            time.sleep(5)
-            pipe_ab.send(processed_message)
-            log_entry(f"[A][{timestamp}] sent to B: {processed_message}", log_file)
-
-
-def process_b(pipe_ab, queue_ba, exit_event, log_file):
-    while not exit_event.is_set():
-        if pipe_ab.poll(timeout=1):
-            message = pipe_ab.recv()
-            timestamp = datetime.now().strftime('%H:%M:%S')
-            if message == "exit":
-                log_entry(f"[B][{timestamp}] exit", log_file)
-                exit_event.set()
+    send = put
+    recv = get
+
+
+def channel_depth(channel):
+    try:
+        return channel.qsize()
+    except (AttributeError, NotImplementedError):
+        return None
+
+
+def _percentiles(samples):
+    if len(samples) > 1:
+        cut = statistics.quantiles(samples, n=100, method='inclusive')
+        return cut[49], cut[94], cut[98]
+    return samples[0], samples[0], samples[0]
+
+
+class TraceCollector:
+    def __init__(self):
+        self.envelopes = []
+        self.peak_depths = {}
+
+    def add(self, envelope):
+        self.envelopes.append(envelope)
+
+    def sample_depth(self, name, channel):
+        depth = channel_depth(channel)
+        if depth is not None:
+            self.peak_depths[name] = max(depth, self.peak_depths.get(name, 0))
+
+    def latencies(self):
+        # Задержка участка - разница соседних отметок; плюс полный путь от первой до последней
+        segments = {}
+        for envelope in self.envelopes:
+            stamps = envelope.stamps
+            for (hop, start), (next_hop, end) in zip(stamps, stamps[1:]):
+                segments.setdefault(f"{hop} -> {next_hop}", []).append(end - start)
+            if len(stamps) > 1:
+                segments.setdefault("end-to-end", []).append(stamps[-1][1] - stamps[0][1])
+        return segments
+
+    def report(self, channels=None):
+        lines = [f"messages traced: {len(self.envelopes)}", "segment\tp50, ms\tp95, ms\tp99, ms"]
+        for segment, samples in self.latencies().items():
+            p50, p95, p99 = _percentiles(samples)
+            lines.append(f"{segment}\t{p50 / 1e6:.3f}\t{p95 / 1e6:.3f}\t{p99 / 1e6:.3f}")
+
+        lines.append("channel\tdepth at shutdown\tpeak depth")
+        if channels is None:
+            channels = dict.fromkeys(self.peak_depths)
+        for name, channel in channels.items():
+            depth = channel_depth(channel)
+            lines.append(
+                f"{name}\t{'n/a' if depth is None else depth}\t{self.peak_depths.get(name, 'n/a')}"
+            )
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for envelope in self.envelopes:
+                record = {'id': envelope.id, 'text': envelope.text, 'stamps': dict(envelope.stamps)}
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def process_a(queue_ab, pipe_ab, log, transform=lowercase, delay=A_DELAY):
+    while True:
+        try:
+            message = queue_ab.get(timeout=GET_TIMEOUT)
+        except queue.Empty:
+            # Просыпаемся раз в GET_TIMEOUT только чтобы не пережить упавший main
+            if not parent_alive():
                 break
+            continue
 
-            encoded_message = codecs.encode(message, 'rot13')
-            print(f"[B][{timestamp}] {encoded_message}")
-            log_entry(f"[B][{timestamp}] Sent: {encoded_message}", log_file)
-            queue_ba.put(encoded_message)
+        if message is STOP:
+            log("exit")
+            pipe_ab.send(STOP)
+            break
 
+        message.stamp('A.dequeue')
+        log(f"delivered #{message.id}: {message.text}")
+        message.text = transform(message.text)
+        if delay:
+            time.sleep(delay)
+        message.stamp('A.processed')
+        log(f"sent to B #{message.id}: {message.text}")
+        message.stamp('A.forward')
+        pipe_ab.send(message)
 
-def main():
-    log_file = "log.txt"
-    open(log_file, 'w').close()
 
-    queue_main_to_a = multiprocessing.Queue()
-    queue_b_to_main = multiprocessing.Queue()
-    pipe_a_to_b, pipe_b_to_a = multiprocessing.Pipe()
-    exit_event = multiprocessing.Event()
+def process_b(pipe_ab, queue_ba, log, transform=rot13, echo=True):
+    while True:
+        if not pipe_ab.poll(timeout=GET_TIMEOUT):
+            if not parent_alive():
+                break
+            continue
+
+        message = pipe_ab.recv()
+        if message is STOP:
+            log("exit")
+            queue_ba.put(STOP)
+            break
+
+        message.stamp('B.dequeue')
+        message.text = transform(message.text)
+        message.stamp('B.processed')
+        if echo:
+            print(f"[B][{now()}] {message.text}")
+        log(f"Sent #{message.id}: {message.text}")
+        message.stamp('B.forward')
+        queue_ba.put(message)
+
+
+def start_pipeline(log_queue, a_delay=A_DELAY, echo=True, transport='queue'):
+    if transport == 'ring':
+        # Каждый канал цепочки ровно с одним писателем и одним читателем, поэтому подходит SPSC-буфер
+        queue_main_to_a, queue_b_to_main = EnvelopeRing(), EnvelopeRing()
+        pipe_a_to_b = pipe_b_to_a = EnvelopeRing()
+    else:
+        queue_main_to_a = multiprocessing.Queue()
+        queue_b_to_main = multiprocessing.Queue()
+        pipe_a_to_b, pipe_b_to_a = multiprocessing.Pipe()
 
     proc_a = multiprocessing.Process(
         target=process_a,
-        args=(queue_main_to_a, pipe_a_to_b, exit_event, log_file)
+        args=(queue_main_to_a, pipe_a_to_b, QueueLogger(log_queue, 'A')),
+        kwargs={'delay': a_delay}
     )
     proc_b = multiprocessing.Process(
         target=process_b,
-        args=(pipe_b_to_a, queue_b_to_main, exit_event, log_file)
+        args=(pipe_b_to_a, queue_b_to_main, QueueLogger(log_queue, 'B')),
+        kwargs={'echo': echo}
     )
 
     proc_a.start()
     proc_b.start()
+    return queue_main_to_a, queue_b_to_main, (proc_a, proc_b), (queue_main_to_a, pipe_a_to_b, queue_b_to_main)
 
-    def read_from_b():
-        while not exit_event.is_set():
-            if not queue_b_to_main.empty():
-                message = queue_b_to_main.get()
-                timestamp = datetime.now().strftime('%H:%M:%S')
-                log_entry(f"[main][{timestamp}] get from B: {message}", log_file)
-                print(f"[main][{timestamp}] Get message: {message}")
 
-    reader_thread = threading.Thread(target=read_from_b, daemon=True)
-    reader_thread.start()
+def stop_pipeline(processes, timeout=2, channels=()):
+    for proc in processes:
+        proc.join(timeout=timeout)
+    for proc in processes:
+        if proc.is_alive():
+            proc.terminate()
+    # Разделяемую память освобождает создавший её процесс, когда стадии уже остановлены
+    for channel in channels:
+        if isinstance(channel, RingBuffer):
+            channel.close()
+            channel.unlink()
 
-    try:
-        while True:
-            user_input = input(f"[main][{datetime.now().strftime('%H:%M:%S')}] Input: ")
-            timestamp = datetime.now().strftime('%H:%M:%S')
-            log_entry(f"[main][{timestamp}] Input: {user_input}", log_file)
-            queue_main_to_a.put(user_input)
-
-            if user_input == "exit":
-                log_entry(f"[main][{timestamp}] exit", log_file)
-                exit_event.set()
+
+class Stage:
+    def __init__(self, name, transform, workers=1, delay=0, echo=False):
+        self.name = name
+        self.transform = transform
+        self.workers = workers
+        self.delay = delay
+        self.echo = echo
+
+
+def default_stages(workers=1, a_delay=A_DELAY, echo=True):
+    return [
+        Stage('A', lowercase, workers=workers, delay=a_delay),
+        Stage('B', rot13, workers=workers, echo=echo),
+    ]
+
+
+def stage_worker(stage, inbox, outbox, log, stops_seen, n_upstream):
+    while True:
+        try:
+            item = inbox.get(timeout=GET_TIMEOUT)
+        except queue.Empty:
+            if not parent_alive():
                 break
-    except KeyboardInterrupt:
-        timestamp = datetime.now().strftime('%H:%M:%S')
-        log_entry(f"[main][{timestamp}] (Ctrl+C)", log_file)
-        exit_event.set()
+            continue
+
+        if item is STOP:
+            # Каждый воркер предыдущей стадии присылает свой STOP после всех своих сообщений.
+            # Увидевший последний из них будит всех воркеров стадии, включая себя
+            with stops_seen.get_lock():
+                stops_seen.value += 1
+                upstream_done = stops_seen.value == n_upstream
+            if upstream_done:
+                for _ in range(stage.workers):
+                    inbox.put(STAGE_STOP)
+            continue
+
+        if item == STAGE_STOP:
+            log("exit")
+            outbox.put(STOP)
+            break
+
+        seq, message = item
+        # С трассировкой Pipeline передаёт Envelope, без неё - просто строку
+        envelope = message if isinstance(message, Envelope) else None
+        if envelope is not None:
+            envelope.stamp(f"{stage.name}.dequeue")
+            message = envelope.text
+        log(f"delivered #{seq}: {message}")
+        text = stage.transform(message)
+        if stage.delay:
+            time.sleep(stage.delay)
+        if stage.echo:
+            print(f"[{stage.name}][{now()}] {text}")
+        result = text
+        if envelope is not None:
+            envelope.text = text
+            envelope.stamp(f"{stage.name}.processed")
+            envelope.stamp(f"{stage.name}.forward")
+            result = envelope
+        outbox.put((seq, result))
+        log(f"sent #{seq}: {text}")
 
-    proc_a.join(timeout=2)
-    proc_b.join(timeout=2)
 
-    if proc_a.is_alive():
-        proc_a.terminate()
-    if proc_b.is_alive():
-        proc_b.terminate()
+class Pipeline:
+    # Стадии связаны ограниченными очередями: медленная стадия тормозит отправителя, а не копит память
+    def __init__(self, stages, log_queue, queue_size=PIPELINE_QUEUE_SIZE, preserve_order=True, tracer=None):
+        self.stages = stages
+        self.preserve_order = preserve_order
+        self.tracer = tracer
+        self.queues = [multiprocessing.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+        self.processes = []
+        self._seq = 0
 
-    log_entry(f"[main][{datetime.now().strftime('%H:%M:%S')}] End", log_file)
+        n_upstream = 1
+        for i, stage in enumerate(stages):
+            stops_seen = multiprocessing.Value('i', 0)
+            for worker in range(stage.workers):
+                self.processes.append(multiprocessing.Process(
+                    target=stage_worker,
+                    args=(stage, self.queues[i], self.queues[i + 1],
+                          QueueLogger(log_queue, f"{stage.name}{worker}"), stops_seen, n_upstream)
+                ))
+            n_upstream = stage.workers
+
+    def start(self):
+        for proc in self.processes:
+            proc.start()
+        return self
+
+    def channel_names(self):
+        hops = ['main'] + [stage.name for stage in self.stages] + ['main']
+        return [f"{left} -> {right}" for left, right in zip(hops, hops[1:])]
+
+    def put(self, message):
+        if self.tracer is not None:
+            message = Envelope(self._seq, message)
+            message.stamp('main.enqueue')
+        self.queues[0].put((self._seq, message))
+        if self.tracer is not None:
+            self.tracer.sample_depth(self.channel_names()[0], self.queues[0])
+        self._seq += 1
+
+    def close(self):
+        self.queues[0].put(STOP)
+
+    def results(self):
+        outbox = self.queues[-1]
+        stops_left = self.stages[-1].workers
+        pending = {}
+        next_seq = 0
+        while stops_left:
+            item = outbox.get()
+            if item is STOP:
+                stops_left -= 1
+                continue
+
+            seq, message = item
+            if isinstance(message, Envelope):
+                message.stamp('main.dequeue')
+                self.tracer.add(message)
+                message = message.text
+            if not self.preserve_order:
+                yield message
+                continue
+            pending[seq] = message
+            while next_seq in pending:
+                yield pending.pop(next_seq)
+                next_seq += 1
+
+        for seq in sorted(pending):
+            yield pending[seq]
+
+
+def measure_throughput(n_messages=10000, log_file=BENCH_LOG_FILE, transport='queue', tracer=None):
+    open(log_file, 'w').close()
+    log_queue, writer = start_log_writer(log_file)
+    queue_in, queue_out, processes, channels = start_pipeline(log_queue, a_delay=0, echo=False, transport=transport)
+    tracer = tracer if tracer is not None else TraceCollector()
+
+    start = time.perf_counter()
+    for i in range(n_messages):
+        envelope = Envelope(i, f"Message {i}")
+        envelope.stamp('main.enqueue')
+        queue_in.put(envelope)
+        tracer.sample_depth('main -> A', queue_in)
+    queue_in.put(STOP)
+
+    received = 0
+    for envelope in iter(queue_out.get, STOP):
+        envelope.stamp('main.dequeue')
+        tracer.add(envelope)
+        received += 1
+    elapsed = time.perf_counter() - start
+
+    stop_pipeline(processes, channels=channels)
+    stop_log_writer(log_queue, writer)
+    return received / elapsed
+
+
+def measure_pipeline_throughput(n_messages=10000, workers=1, preserve_order=True, log_file=BENCH_LOG_FILE,
+                                tracer=None):
+    open(log_file, 'w').close()
+    log_queue, writer = start_log_writer(log_file)
+    pipeline = Pipeline(
+        default_stages(workers, a_delay=0, echo=False), log_queue, preserve_order=preserve_order, tracer=tracer
+    )
+    pipeline.start()
+
+    def feed():
+        for i in range(n_messages):
+            pipeline.put(f"Message {i}")
+        pipeline.close()
+
+    start = time.perf_counter()
+    # Очереди ограничены, поэтому отправка идёт в отдельном потоке параллельно с чтением
+    feeder = threading.Thread(target=feed)
+    feeder.start()
+    received = sum(1 for _ in pipeline.results())
+    elapsed = time.perf_counter() - start
+
+    feeder.join()
+    stop_pipeline(pipeline.processes)
+    stop_log_writer(log_queue, writer)
+    return received / elapsed
+
+
+class PipeChannel:
+    def __init__(self):
+        self._reader, self._writer = multiprocessing.Pipe(duplex=False)
+
+    def put(self, obj):
+        self._writer.send(obj)
+
+    def get(self):
+        return self._reader.recv()
+
+
+def _make_channel(transport):
+    if transport == 'ring':
+        return RingBuffer()
+    if transport == 'pipe':
+        return PipeChannel()
+    return multiprocessing.Queue()
+
+
+def _echo(inbound, outbound, n_messages):
+    for _ in range(n_messages):
+        outbound.put(inbound.get())
+
+
+def benchmark_transports(payload_sizes=(64, 1024, 64 * 1024, 1024 * 1024), n_messages=2000,
+                         transports=('queue', 'pipe', 'ring')):
+    # Сообщения уходят в эхо-процесс и возвращаются: меряем и поток, и задержку туда-обратно
+    results = []
+    for size in payload_sizes:
+        payload = bytes(size)
+        for transport in transports:
+            forward, backward = _make_channel(transport), _make_channel(transport)
+            echo = multiprocessing.Process(target=_echo, args=(forward, backward, n_messages + 1))
+            echo.start()
+            forward.put(payload)
+            backward.get()
+
+            round_trips = []
+            for _ in range(min(n_messages // 2, 200)):
+                start = time.perf_counter_ns()
+                forward.put(payload)
+                backward.get()
+                round_trips.append(time.perf_counter_ns() - start)
+
+            def pump(count):
+                for _ in range(count):
+                    forward.put(payload)
+
+            count = n_messages - len(round_trips)
+            pumper = threading.Thread(target=pump, args=(count,))
+            start = time.perf_counter()
+            pumper.start()
+            for _ in range(count):
+                backward.get()
+            elapsed = time.perf_counter() - start
+            pumper.join()
+            echo.join()
+
+            stop_pipeline((), channels=(forward, backward))
+
+            results.append({
+                'payload': size,
+                'transport': transport,
+                'msg_per_s': count / elapsed,
+                'mb_per_s': count * size / elapsed / 2 ** 20,
+                'p50_us': statistics.median(round_trips) / 1000,
+            })
+    return results
+
+
+def _log_direct(log_file, stage, n_records):
+    for i in range(n_records):
+        log_entry(f"[{stage}][{now()}] record {i}", log_file)
+
+
+def _log_queued(log, n_records):
+    for i in range(n_records):
+        log(f"record {i}")
+
+
+def benchmark_logging(n_records=10000, n_stages=3, log_file=BENCH_LOG_FILE):
+    # Сравниваем открытие файла на каждую строку с очередью и отдельным писателем
+    results = {}
+
+    open(log_file, 'w').close()
+    start = time.perf_counter()
+    stages = [
+        multiprocessing.Process(target=_log_direct, args=(log_file, f"S{i}", n_records))
+        for i in range(n_stages)
+    ]
+    for stage in stages:
+        stage.start()
+    for stage in stages:
+        stage.join()
+    results['log_entry'] = n_stages * n_records / (time.perf_counter() - start)
+
+    open(log_file, 'w').close()
+    start = time.perf_counter()
+    log_queue, writer = start_log_writer(log_file)
+    stages = [
+        multiprocessing.Process(target=_log_queued, args=(QueueLogger(log_queue, f"S{i}"), n_records))
+        for i in range(n_stages)
+    ]
+    for stage in stages:
+        stage.start()
+    for stage in stages:
+        stage.join()
+    stop_log_writer(log_queue, writer)
+    results['log_writer'] = n_stages * n_records / (time.perf_counter() - start)
+
+    return results
+
+
+def main(workers=None, transport='queue', trace_file=None):
+    log_file = "log.txt"
+    open(log_file, 'w').close()
+
+    log_queue, writer = start_log_writer(log_file)
+    # Писатель лога останавливается и при исключении, иначе main повиснет на его завершении
+    try:
+        log = QueueLogger(log_queue, 'main')
+        tracer = TraceCollector()
+        if workers:
+            pipeline = Pipeline(default_stages(workers), log_queue, tracer=tracer).start()
+            send, results, close, processes = pipeline.put, pipeline.results(), pipeline.close, pipeline.processes
+            queue_names, channels = pipeline.channel_names(), pipeline.queues
+        else:
+            queue_main_to_a, queue_b_to_main, processes, channels = start_pipeline(log_queue, transport=transport)
+            queue_names = ('main -> A', 'A -> B', 'B -> main')
+            message_ids = iter(range(1 << 62))
+
+            def send(text):
+                envelope = Envelope(next(message_ids), text)
+                envelope.stamp('main.enqueue')
+                queue_main_to_a.put(envelope)
+                tracer.sample_depth('main -> A', queue_main_to_a)
+
+            def traced_results():
+                for envelope in iter(queue_b_to_main.get, STOP):
+                    envelope.stamp('main.dequeue')
+                    tracer.add(envelope)
+                    yield envelope.text
+
+            def close():
+                queue_main_to_a.put(STOP)
+
+            results = traced_results()
+
+        def read_from_b():
+            for message in results:
+                log(f"get from B: {message}")
+                print(f"[main][{now()}] Get message: {message}")
+
+        reader_thread = threading.Thread(target=read_from_b, daemon=True)
+        reader_thread.start()
+
+        try:
+            while True:
+                user_input = input(f"[main][{now()}] Input: ")
+                log(f"Input: {user_input}")
+
+                if user_input == "exit":
+                    log("exit")
+                    break
+                send(user_input)
+        except KeyboardInterrupt:
+            log("(Ctrl+C)")
+        except EOFError:
+            log("(EOF)")
+
+        # STOP встаёт в очередь после уже отправленных сообщений, поэтому они успевают пройти A и B
+        close()
+        reader_thread.join(timeout=DRAIN_TIMEOUT)
+        print(tracer.report(dict(zip(queue_names, channels))))
+        if trace_file:
+            tracer.dump(trace_file)
+        stop_pipeline(processes, channels=channels)
+
+        log("End")
+    finally:
+        stop_log_writer(log_queue, writer)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Цепочка процессов main -> A -> B -> main')
+    parser.add_argument('--bench', type=int, metavar='N', help='Прогнать N сообщений без задержек и вывести пропускную способность')
+    parser.add_argument('--bench-log', type=int, metavar='N', help='Сравнить скорость логирования N записей на стадию')
+    parser.add_argument('--workers', type=int, help='Количество воркеров на стадию (включает масштабируемый конвейер)')
+    parser.add_argument('--transport', choices=('queue', 'ring'), default='queue', help='Транспорт между main, A и B')
+    parser.add_argument('--bench-transport', type=int, metavar='N', help='Сравнить Queue, Pipe и кольцевой буфер на N сообщениях')
+    parser.add_argument('--trace', metavar='FILE', help='Сохранить трассировку сообщений в JSON Lines')
+    args = parser.parse_args()
+
+    if args.bench:
+        tracer = TraceCollector()
+        if args.workers:
+            rate = measure_pipeline_throughput(args.bench, args.workers, tracer=tracer)
+        else:
+            rate = measure_throughput(args.bench, transport=args.transport, tracer=tracer)
+        print(f"{rate:.1f} msg/s")
+        print(tracer.report())
+        if args.trace:
+            tracer.dump(args.trace)
+    elif args.bench_transport:
+        print("payload\ttransport\tmsg/s\tMB/s\tp50 RTT, us")
+        for row in benchmark_transports(n_messages=args.bench_transport):
+            print(f"{row['payload']}\t{row['transport']}\t{row['msg_per_s']:.1f}\t{row['mb_per_s']:.1f}\t{row['p50_us']:.1f}")
+    elif args.bench_log:
+        for name, rate in benchmark_logging(args.bench_log).items():
+            print(f"{name}: {rate:.1f} records/s")
+    else:
+        main(args.workers, args.transport, args.trace)
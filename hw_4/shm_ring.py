@@ -0,0 +1,126 @@
+import multiprocessing
+import pickle
+import queue
+import struct
+from multiprocessing import shared_memory
+
+RING_CAPACITY = 4 << 20
+SPACE_WAIT = 1
+
+# Счётчики записи и чтения лежат в разных кэш-линиях, чтобы производитель и потребитель не мешали друг другу
+_HEAD_OFFSET = 0
+_WRITTEN_OFFSET = 8
+_TAIL_OFFSET = 64
+_READ_OFFSET = 72
+_DATA_OFFSET = 128
+_COUNTER = struct.Struct('<Q')
+_RECORD = struct.Struct('<II')  # длина полезной нагрузки и её тип
+
+_BYTES, _STR, _PICKLE = range(3)
+
+
+def _encode(obj):
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return _BYTES, obj
+    if isinstance(obj, str):
+        return _STR, obj.encode()
+    return _PICKLE, pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _decode(kind, payload):
+    if kind == _BYTES:
+        return payload
+    if kind == _STR:
+        return payload.decode()
+    return pickle.loads(payload)
+
+
+class RingBuffer:
+    # Кольцевой буфер в разделяемой памяти для одного писателя и одного читателя.
+    # Записи: заголовок (длина, тип) + байты; str и bytes кладутся как есть, без pickle
+    def __init__(self, capacity=RING_CAPACITY, ctx=None):
+        ctx = ctx or multiprocessing.get_context()
+        self.capacity = capacity
+        self._shm = shared_memory.SharedMemory(create=True, size=_DATA_OFFSET + capacity)
+        self._shm.buf[:_DATA_OFFSET] = bytes(_DATA_OFFSET)
+        self._items = ctx.Semaphore(0)
+        self._space_freed = ctx.Event()
+        self._ready = 0
+
+    def _load(self, offset):
+        return _COUNTER.unpack_from(self._shm.buf, offset)[0]
+
+    def _store(self, offset, value):
+        _COUNTER.pack_into(self._shm.buf, offset, value)
+
+    def _write(self, position, data):
+        start = position % self.capacity
+        first = min(len(data), self.capacity - start)
+        buf = self._shm.buf
+        buf[_DATA_OFFSET + start:_DATA_OFFSET + start + first] = data[:first]
+        if first < len(data):
+            buf[_DATA_OFFSET:_DATA_OFFSET + len(data) - first] = data[first:]
+
+    def _read(self, position, size):
+        start = position % self.capacity
+        first = min(size, self.capacity - start)
+        buf = self._shm.buf
+        data = bytes(buf[_DATA_OFFSET + start:_DATA_OFFSET + start + first])
+        if first < size:
+            data += bytes(buf[_DATA_OFFSET:_DATA_OFFSET + size - first])
+        return data
+
+    def put(self, obj):
+        kind, payload = _encode(obj)
+        payload = memoryview(payload).cast('B')
+        needed = _RECORD.size + len(payload)
+        if needed > self.capacity:
+            raise ValueError(f"Запись размером {needed} байт не помещается в буфер {self.capacity} байт")
+
+        head = self._load(_HEAD_OFFSET)
+        while self.capacity - (head - self._load(_TAIL_OFFSET)) < needed:
+            # Сбрасываем событие до повторной проверки, чтобы не пропустить освобождение места
+            self._space_freed.clear()
+            if self.capacity - (head - self._load(_TAIL_OFFSET)) >= needed:
+                break
+            self._space_freed.wait(SPACE_WAIT)
+
+        self._write(head, _RECORD.pack(len(payload), kind))
+        self._write(head + _RECORD.size, payload)
+        self._store(_HEAD_OFFSET, head + needed)
+        self._store(_WRITTEN_OFFSET, self._load(_WRITTEN_OFFSET) + 1)
+        self._items.release()
+
+    def poll(self, timeout=None):
+        if self._ready:
+            return True
+        if self._items.acquire(timeout=timeout):
+            self._ready += 1
+            return True
+        return False
+
+    def get(self, timeout=None):
+        if not self.poll(timeout):
+            raise queue.Empty
+        self._ready -= 1
+
+        tail = self._load(_TAIL_OFFSET)
+        size, kind = _RECORD.unpack(self._read(tail, _RECORD.size))
+        payload = self._read(tail + _RECORD.size, size)
+        self._store(_TAIL_OFFSET, tail + _RECORD.size + size)
+        self._store(_READ_OFFSET, self._load(_READ_OFFSET) + 1)
+        self._space_freed.set()
+        return _decode(kind, payload)
+
+    def qsize(self):
+        return self._load(_WRITTEN_OFFSET) - self._load(_READ_OFFSET)
+
+    # Интерфейс Pipe, чтобы буфер мог заменить pipe_ab без изменений в стадиях
+    send = put
+    recv = get
+
+    def close(self):
+        self._shm.close()
+
+    def unlink(self):
+        self._shm.unlink()
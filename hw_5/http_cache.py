@@ -0,0 +1,145 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict, namedtuple
+from pathlib import Path
+
+HTTP_CACHE_MAX_BYTES = 64 << 20  # 64 МиБ тел страниц на диске
+INDEX_NAME = 'index.json'
+# Через столько ответов 304 порядок обращений сохраняется в index.json, чтобы вытеснение после перезапуска оставалось LRU
+INDEX_FLUSH_HITS = 16
+
+# status: 200 - тело загружено, 304 - сервер подтвердил, что страница не изменилась, тело взято с диска
+CachedPage = namedtuple('CachedPage', ['url', 'status', 'text', 'digest'])
+
+
+def _write_atomic(path: Path, data: bytes):
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def _remove_quietly(path: Path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class HttpCache:
+    # Кэш страниц для условных GET-запросов: по URL хранятся ETag, Last-Modified и sha256 тела.
+    # Тела лежат на диске под своим хэшем, при превышении max_bytes вытесняются давно не запрошенные URL
+    def __init__(self, cache_dir, max_bytes=HTTP_CACHE_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.index_path = self.cache_dir / INDEX_NAME
+        # Порядок записей - порядок обращений, первая запись вытесняется первой
+        self.entries = OrderedDict()
+        if self.index_path.exists():
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.entries = OrderedDict(json.load(f))
+        self.stats = {'not_modified': 0, 'unchanged': 0, 'changed': 0, 'evicted': 0}
+        self._lock = None
+        self._unsaved_hits = 0
+
+    def _body_path(self, digest):
+        return self.cache_dir / f"{digest}.html"
+
+    def _stored_bytes(self):
+        sizes = {entry['digest']: entry['size'] for entry in self.entries.values()}
+        return sum(sizes.values())
+
+    def _conditional_headers(self, url):
+        entry = self.entries.get(url)
+        if entry is None or not self._body_path(entry['digest']).exists():
+            return {}
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def _evict(self):
+        evicted = []
+        while len(self.entries) > 1 and self._stored_bytes() > self.max_bytes:
+            _, entry = self.entries.popitem(last=False)
+            self.stats['evicted'] += 1
+            # Одно тело может принадлежать нескольким URL, удаляем его вместе с последней ссылкой
+            if all(other['digest'] != entry['digest'] for other in self.entries.values()):
+                evicted.append(self._body_path(entry['digest']))
+        return evicted
+
+    def _flush(self, body_path, body, evicted, index):
+        if body_path is not None and not body_path.exists():
+            _write_atomic(body_path, body)
+        for path in evicted:
+            _remove_quietly(path)
+        _write_atomic(self.index_path, index)
+
+    async def _store(self, url, response, body, digest):
+        self.entries[url] = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'digest': digest,
+            'size': len(body),
+        }
+        self.entries.move_to_end(url)
+        await self._persist(self._body_path(digest), body, self._evict())
+
+    async def _persist(self, body_path=None, body=None, evicted=()):
+        # Записи на диск идут по одной, иначе параллельные загрузки перезаписывают общий index.json.tmp
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            self._unsaved_hits = 0
+            index = json.dumps(self.entries, ensure_ascii=False).encode('utf-8')
+            await loop.run_in_executor(None, self._flush, body_path, body, evicted, index)
+
+    async def flush(self):
+        # Сохраняет порядок обращений, накопленный ответами 304 с последней записи индекса
+        if self._unsaved_hits:
+            await self._persist()
+
+    async def _read(self, url):
+        entry = self.entries.get(url)
+        if entry is None:
+            return None
+        loop = asyncio.get_running_loop()
+        try:
+            body = await loop.run_in_executor(None, self._body_path(entry['digest']).read_bytes)
+        except FileNotFoundError:
+            return None
+        self.entries.move_to_end(url)
+        self._unsaved_hits += 1
+        if self._unsaved_hits >= INDEX_FLUSH_HITS:
+            await self._persist()
+        return CachedPage(url, 304, body.decode('utf-8'), entry['digest'])
+
+    async def fetch(self, session, url, headers=None):
+        conditional = self._conditional_headers(url)
+        async with session.get(url, headers={**(headers or {}), **conditional}) as response:
+            if response.status == 304 and conditional:
+                page = await self._read(url)
+                if page is not None:
+                    self.stats['not_modified'] += 1
+                    return page
+            elif response.status != 200:
+                return CachedPage(url, response.status, None, None)
+            else:
+                text = await response.text()
+
+        if response.status == 304:
+            # Тело вытеснили, пока шёл запрос: повторяем его без условных заголовков
+            self.entries.pop(url, None)
+            return await self.fetch(session, url, headers)
+
+        body = text.encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()
+        entry = self.entries.get(url)
+        self.stats['unchanged' if entry and entry['digest'] == digest else 'changed'] += 1
+        await self._store(url, response, body, digest)
+        return CachedPage(url, 200, text, digest)
@@ -0,0 +1,199 @@
+import asyncio
+import atexit
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from http_cache import HTTP_CACHE_MAX_BYTES, HttpCache
+
+PARSER_BACKENDS = ('html.parser', 'lxml')
+DEFAULT_BACKEND = 'lxml'
+DEFAULT_PARSE_WORKERS = max(1, (os.cpu_count() or 1) - 1)
+# Пул создаётся уже внутри цикла событий, когда работают потоки aiohttp и бота: fork такого процесса
+# может унаследовать захваченные блокировки, поэтому воркеры запускаются через forkserver или spawn
+PARSE_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def _cian_offer(item):
+    return {
+        'title': item.select_one('[data-name="TitleComponent"]').get_text(strip=True),
+        'price': item.select_one('[data-mark="MainPrice"]').get_text(strip=True),
+        'address': item.select_one('[data-name="GeoLabel"]').get_text(strip=True),
+        'url': "https://cian.ru" + item.select_one('a[data-name="LinkArea"]')['href'],
+    }
+
+
+def _yandex_offer(item):
+    return {
+        'title': item.select_one('span[data-test="offer-title"]').get_text(strip=True),
+        'price': item.select_one('span[data-test="offer-price"]').get_text(strip=True),
+        'address': item.select_one('div[data-test="address"]').get_text(strip=True),
+        'url': "https://realty.yandex.ru" + item.find('a')['href'],
+    }
+
+
+def _avito_offer(item):
+    return {
+        'title': item.select_one('h3[itemprop="name"]').get_text(strip=True),
+        'price': item.select_one('meta[itemprop="price"]')['content'] + " ₽",
+        'address': item.select_one('[data-marker="item-address"]').get_text(strip=True),
+        'url': "https://www.avito.ru" + item.select_one('a[data-marker="item-title"]')['href'],
+    }
+
+
+# Для каждого источника: карточка объявления (тег и атрибуты), название для сообщений и разбор полей
+SOURCES = {
+    'cian': ('article', {'data-name': 'CardComponent'}, 'CIAN', _cian_offer),
+    'yandex': ('article', {'data-test': 'offer-card'}, 'Яндекс', _yandex_offer),
+    'avito': ('div', {'data-marker': 'item'}, 'Авито', _avito_offer),
+}
+
+
+def parse_listing(source: str, html: str, backend: str = DEFAULT_BACKEND, strainer: bool = True):
+    # Возвращает словари объявлений без даты и сообщения об ошибках разбора отдельных карточек
+    if backend not in PARSER_BACKENDS:
+        raise ValueError(f"Неизвестный парсер: {backend}")
+    tag, attrs, label, parse_offer = SOURCES[source]
+
+    # SoupStrainer строит дерево только из карточек, остальная страница пропускается
+    parse_only = SoupStrainer(tag, attrs=attrs) if strainer else None
+    soup = BeautifulSoup(html, backend, parse_only=parse_only)
+
+    offers, errors = [], []
+    for item in soup.find_all(tag, attrs=attrs):
+        try:
+            offers.append({'source': source, **parse_offer(item)})
+        except Exception as e:
+            errors.append(f"Ошибка парсинга объявления {label}: {str(e)}")
+    return offers, errors
+
+
+_executor = None
+_executor_workers = None
+
+
+def get_parse_executor(workers: int = DEFAULT_PARSE_WORKERS):
+    global _executor, _executor_workers
+    if _executor is not None and _executor_workers == workers:
+        return _executor
+
+    shutdown_parse_executor()
+    _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(PARSE_START_METHOD))
+    _executor_workers = workers
+    return _executor
+
+
+def shutdown_parse_executor():
+    global _executor, _executor_workers
+    if _executor is not None:
+        _executor.shutdown()
+    _executor = None
+    _executor_workers = None
+
+
+atexit.register(shutdown_parse_executor)
+
+
+async def parse_listing_async(source: str, html: str, backend: str = DEFAULT_BACKEND, strainer: bool = True,
+                              workers: int = DEFAULT_PARSE_WORKERS):
+    # Разбор страницы уходит в пул процессов, цикл событий продолжает обслуживать запросы и бота.
+    # workers=0 - разбор в текущем потоке
+    if not workers:
+        offers, errors = parse_listing(source, html, backend, strainer)
+    else:
+        loop = asyncio.get_running_loop()
+        offers, errors = await loop.run_in_executor(
+            get_parse_executor(workers), parse_listing, source, html, backend, strainer
+        )
+    for message in errors:
+        print(message)
+    return offers
+
+
+class ListingScraper:
+    # Общая часть скраперов task5_2 и task5_3: условные запросы через HttpCache и разбор без повторов
+    def __init__(self, cache_dir, parser_backend=DEFAULT_BACKEND, use_strainer=True,
+                 parse_workers=DEFAULT_PARSE_WORKERS, cache_max_bytes=HTTP_CACHE_MAX_BYTES):
+        self.parser_backend = parser_backend
+        self.use_strainer = use_strainer
+        self.parse_workers = parse_workers
+        self.http_cache = HttpCache(cache_dir, cache_max_bytes)
+        self._parsed = {}
+        self.user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+        self.headers = {"User-Agent": self.user_agent}
+
+    async def fetch_page(self, session, url):
+        # Условный запрос через кэш: при ответе 304 тело берётся с диска
+        try:
+            page = await self.http_cache.fetch(session, url, self.headers)
+        except Exception as e:
+            print(f"Ошибка при запросе {url}: {str(e)}")
+            return None
+        if page.text is None:
+            print(f"Ошибка {page.status} при запросе {url}")
+            return None
+        return page
+
+    async def fetch(self, session, url):
+        page = await self.fetch_page(session, url)
+        return page.text if page else None
+
+    async def _parse(self, source, page):
+        # Страница с тем же хэшем тела уже разобрана - повторный разбор не нужен
+        previous = self._parsed.get(page.url)
+        if previous is not None and previous[0] == page.digest:
+            return previous[1]
+
+        offers = await parse_listing_async(
+            source, page.text, self.parser_backend, self.use_strainer, self.parse_workers
+        )
+        self._parsed[page.url] = (page.digest, offers)
+        return offers
+
+
+def load_pages(pages_dir: str):
+    # Сохранённые страницы выдачи называются {source}_*.html, например cian_1.html
+    pages = []
+    for path in sorted(Path(pages_dir).glob('*.html')):
+        source = path.name.split('_', 1)[0]
+        if source in SOURCES:
+            pages.append((source, path.read_text(encoding='utf-8')))
+    return pages
+
+
+def benchmark_parsers(pages, repeat: int = 3):
+    variants = [(backend, strainer) for backend in PARSER_BACKENDS for strainer in (False, True)]
+    results = []
+    for backend, strainer in variants:
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            count = sum(len(parse_listing(source, html, backend, strainer)[0]) for source, html in pages)
+            best = min(best, time.perf_counter() - start)
+        results.append((backend, strainer, count, best))
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Сравнение парсеров на сохранённых страницах выдачи')
+    parser.add_argument('--pages', type=str, default='realty_pages', help='Папка с файлами {source}_*.html')
+    parser.add_argument('--repeat', type=int, default=3, help='Число повторов каждого замера')
+
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages)
+    if not pages:
+        raise SystemExit(f"В папке {args.pages} нет страниц вида {{source}}_*.html")
+
+    total_bytes = sum(len(html.encode()) for _, html in pages)
+    with open('parsing_benchmark.txt', 'w') as f:
+        f.write(f"pages={len(pages)}\tbytes={total_bytes}\n")
+        f.write("backend\tstrainer\toffers\tseconds\tms_per_page\n")
+        for backend, strainer, count, seconds in benchmark_parsers(pages, args.repeat):
+            f.write(f"{backend}\t{strainer}\t{count}\t{seconds:.4f}\t{seconds / len(pages) * 1000:.2f}\n")
@@ -1,40 +1,424 @@
 import aiohttp
 import asyncio
+import hashlib
+import itertools
+import json
 import os
+import random
+import shutil
+import statistics
+import sys
+import time
 from urllib.parse import urljoin
 from pathlib import Path
 
+URL_TEMPLATE = "https://picsum.photos/2000/2000?random={index}"
+DEFAULT_CONCURRENCY = 32
+DNS_CACHE_TTL = 300  # секунд
+KEEPALIVE_TIMEOUT = 30  # секунд
+CHUNK_SIZE = 1 << 20  # Запись на диск блоками по 1 МиБ
+REQUEST_TIMEOUT = 60  # секунд на один запрос целиком
+CONNECT_TIMEOUT = 10  # секунд
+READ_TIMEOUT = 30  # секунд без новых данных от сервера
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5  # секунд
+BACKOFF_MAX = 30  # секунд
+PROGRESS_INTERVAL = 1  # секунд
+MANIFEST_NAME = 'manifest.json'
+BLOBS_DIR = '.blobs'
+MANIFEST_FLUSH_EVERY = 100  # Сохранять манифест после каждых N завершённых загрузок
 
-async def download_image(session: aiohttp.ClientSession, save_dir: str, index: int):
-    url = f"https://picsum.photos/2000/2000?random={index}"
-    filename = os.path.join(save_dir, f"image_{index}.jpg")
 
+def _remove_quietly(path: str):
     try:
-        async with session.get(url) as response:
-            if response.status == 200:
-                with open(filename, 'wb') as f:
-                    while True:
-                        chunk = await response.content.read(1024)
-                        if not chunk:
-                            break
-                        f.write(chunk)
-                print(f"Успешно загружено: {filename}")
-            else:
-                print(f"Ошибка загрузки {url}: статус {response.status}")
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def _hash_file(path: str, chunk_size: int):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest
+
+
+def _write_chunk(f, digest, data):
+    f.write(data)
+    digest.update(data)
+
+
+def _write_atomic(path: str, text: str):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _link_or_copy(source: str, target: str):
+    # Жёсткая ссылка: одинаковые изображения занимают место на диске один раз
+    tmp_target = target + '.link'
+    _remove_quietly(tmp_target)
+    try:
+        os.link(source, tmp_target)
+    except OSError:
+        shutil.copyfile(source, tmp_target)
+    os.replace(tmp_target, target)
+
+
+def _store_blob(tmp_filename: str, filename: str, blob_path: str) -> bool:
+    deduplicated = os.path.exists(blob_path)
+    if deduplicated:
+        os.remove(tmp_filename)
+    else:
+        os.replace(tmp_filename, blob_path)
+    _link_or_copy(blob_path, filename)
+    return deduplicated
+
+
+def _validator(headers) -> str:
+    # Для If-Range годится только сильный ETag, слабый (W/...) сервер обязан игнорировать
+    etag = headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return headers.get('Last-Modified')
+
+
+def _content_range(value: str):
+    # "bytes 100-999/1000" -> (100, 1000), "bytes */1000" -> (None, 1000)
+    try:
+        _, spec = value.split(' ', 1)
+        positions, total = spec.split('/')
+        start = None if positions == '*' else int(positions.split('-')[0])
+        return start, None if total == '*' else int(total)
+    except (AttributeError, ValueError):
+        return None, None
+
+
+class DownloadError(Exception):
+    def __init__(self, url: str, status: int):
+        super().__init__(f"Ошибка загрузки {url}: статус {status}")
+        self.status = status
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, DownloadError):
+        return error.status >= 500
+    return isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError))
+
+
+def _backoff_delay(attempt: int) -> float:
+    # Полный джиттер: повторы от разных воркеров не приходят на сервер одновременно
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class DownloadStats:
+    # total неизвестен, если индексы переданы генератором
+    def __init__(self, total: int = None, skipped: int = 0):
+        self.total = total
+        self.skipped = skipped
+        self.completed = 0
+        self.deduplicated = 0
+        self.retries = 0
+        self.bytes = 0
+        self.in_flight = 0
+        self.latencies = []
+        self.errors = {}
+        self.timed_out = False
+        self.started = time.perf_counter()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def p95_latency(self) -> float:
+        if len(self.latencies) < 2:
+            return self.latencies[0] if self.latencies else 0.0
+        return statistics.quantiles(self.latencies, n=100, method='inclusive')[94]
+
+    def progress_line(self) -> str:
+        elapsed = self.elapsed() or 1e-9
+        done = self.completed + len(self.errors)
+        return (
+            f"{done}/{self.total if self.total is not None else '?'} | {self.completed / elapsed:.1f} изобр/с | "
+            f"{self.bytes / elapsed / 2 ** 20:.2f} МБ/с | в работе {self.in_flight} | "
+            f"p95 {self.p95_latency():.2f} с"
+        )
+
+    def summary(self) -> dict:
+        elapsed = self.elapsed()
+        return {
+            'total': self.total if self.total is not None else self.skipped + self.completed + len(self.errors),
+            'completed': self.completed,
+            'skipped': self.skipped,
+            'failed': len(self.errors),
+            'deduplicated': self.deduplicated,
+            'retries': self.retries,
+            'timed_out': self.timed_out,
+            'bytes': self.bytes,
+            'elapsed_s': round(elapsed, 3),
+            'images_per_s': round(self.completed / elapsed, 3) if elapsed else 0.0,
+            'mb_per_s': round(self.bytes / elapsed / 2 ** 20, 3) if elapsed else 0.0,
+            'p50_latency_s': round(statistics.median(self.latencies), 3) if self.latencies else 0.0,
+            'p95_latency_s': round(self.p95_latency(), 3),
+            'errors': {str(index): message for index, message in sorted(self.errors.items())},
+        }
+
+
+async def _report_progress(stats: DownloadStats, interval: float = PROGRESS_INTERVAL):
+    # Прогресс пишется в stderr одной обновляемой строкой, stdout остаётся под итоговый JSON
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            print('\r' + stats.progress_line(), end='', file=sys.stderr, flush=True)
+    finally:
+        print('\r' + stats.progress_line(), file=sys.stderr, flush=True)
+
+
+class DownloadManifest:
+    # Состояние загрузки по индексам: размер, sha256 и статус (complete, partial, failed).
+    # Тела хранятся в .blobs под своим хэшем, image_{index}.jpg - ссылки на них
+    def __init__(self, save_dir: str):
+        self.save_dir = save_dir
+        self.path = os.path.join(save_dir, MANIFEST_NAME)
+        self.blob_dir = os.path.join(save_dir, BLOBS_DIR)
+        Path(self.blob_dir).mkdir(parents=True, exist_ok=True)
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.entries = {int(index): entry for index, entry in json.load(f).items()}
+        self._unsaved = 0
+        self._lock = None
+
+    def filename(self, index: int) -> str:
+        return os.path.join(self.save_dir, f"image_{index}.jpg")
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest + '.jpg')
+
+    def is_complete(self, index: int) -> bool:
+        entry = self.entries.get(index)
+        return (
+            entry is not None
+            and entry['status'] == 'complete'
+            and _file_size(self.filename(index)) == entry['size']
+        )
+
+    def validator(self, index: int):
+        entry = self.entries.get(index)
+        return entry.get('validator') if entry else None
+
+    def record(self, index: int, status: str, **fields):
+        self.entries[index] = {'status': status, **fields}
+        self._unsaved += 1
+
+    def dumps(self) -> str:
+        self._unsaved = 0
+        return json.dumps({str(index): entry for index, entry in sorted(self.entries.items())})
+
+    async def flush(self, force: bool = False):
+        if self._unsaved and (force or self._unsaved >= MANIFEST_FLUSH_EVERY):
+            # Записи идут по одной, иначе параллельные flush перезаписывают общий manifest.json.tmp
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            loop = asyncio.get_running_loop()
+            async with self._lock:
+                await loop.run_in_executor(None, _write_atomic, self.path, self.dumps())
+
+
+async def download_image(session: aiohttp.ClientSession, manifest: DownloadManifest, index: int,
+                         stats: DownloadStats, chunk_size: int = CHUNK_SIZE) -> bool:
+    url = URL_TEMPLATE.format(index=index)
+    filename = manifest.filename(index)
+    # Недокачанное тело остаётся в .part и дозагружается запросом с Range при следующем запуске
+    tmp_filename = filename + '.part'
+    loop = asyncio.get_running_loop()
+
+    offset = await loop.run_in_executor(None, _file_size, tmp_filename)
+    validator = manifest.validator(index) if offset else None
+    if offset and not validator:
+        # Без ETag или Last-Modified нельзя проверить, что сервер отдаст то же тело, и докачка склеит разные файлы
+        await loop.run_in_executor(None, _remove_quietly, tmp_filename)
+        offset = 0
+
+    try:
+        while True:
+            headers = {'Range': f'bytes={offset}-', 'If-Range': validator} if offset else None
+            async with session.get(url, headers=headers) as response:
+                if response.status == 206 and offset:
+                    start, _ = _content_range(response.headers.get('Content-Range'))
+                    mode = 'ab' if start == offset else None
+                elif response.status == 416 and offset:
+                    # .part уже содержит всё тело: процесс остановился между закрытием файла и переименованием
+                    _, total = _content_range(response.headers.get('Content-Range'))
+                    mode = 'complete' if total == offset else None
+                elif response.status == 200:
+                    mode = 'wb'
+                else:
+                    manifest.record(index, 'failed', http_status=response.status)
+                    raise DownloadError(url, response.status)
+
+                if mode is None:
+                    # Ответ не продолжает наш .part: начинаем загрузку с нуля
+                    await loop.run_in_executor(None, _remove_quietly, tmp_filename)
+                    offset, validator = 0, None
+                    continue
+
+                if mode == 'wb':
+                    digest = hashlib.sha256()
+                    offset = 0
+                    validator = _validator(response.headers)
+                    manifest.record(index, 'partial', size=0, validator=validator)
+                else:
+                    digest = await loop.run_in_executor(None, _hash_file, tmp_filename, chunk_size)
+                if mode == 'complete':
+                    break
+
+                # Работа с диском уходит в пул потоков, цикл событий продолжает обслуживать другие загрузки
+                f = await loop.run_in_executor(None, open, tmp_filename, mode)
+                try:
+                    buffer = bytearray()
+                    async for chunk in response.content.iter_chunked(chunk_size):
+                        buffer += chunk
+                        stats.bytes += len(chunk)
+                        if len(buffer) >= chunk_size:
+                            data, buffer = buffer, bytearray()
+                            await loop.run_in_executor(None, _write_chunk, f, digest, data)
+                finally:
+                    # Остаток буфера сохраняется и при обрыве, чтобы докачка началась с последнего полученного байта
+                    if buffer:
+                        await loop.run_in_executor(None, _write_chunk, f, digest, buffer)
+                    await loop.run_in_executor(None, f.close)
+            break
+
+        size = await loop.run_in_executor(None, _file_size, tmp_filename)
+        sha256 = digest.hexdigest()
+        deduplicated = await loop.run_in_executor(
+            None, _store_blob, tmp_filename, filename, manifest.blob_path(sha256)
+        )
+        manifest.record(index, 'complete', size=size, sha256=sha256, resumed_from=offset)
+        return deduplicated
+    except DownloadError:
+        raise
     except Exception as e:
-        print(f"Ошибка при загрузке {url}: {str(e)}")
+        size = await loop.run_in_executor(None, _file_size, tmp_filename)
+        manifest.record(
+            index, 'partial' if size else 'failed', size=size, validator=validator, error=str(e) or type(e).__name__
+        )
+        raise
+    finally:
+        await manifest.flush()
+
 
+async def download_with_retries(session: aiohttp.ClientSession, manifest: DownloadManifest, index: int,
+                                stats: DownloadStats, chunk_size: int = CHUNK_SIZE, retries: int = MAX_RETRIES):
+    # Повтор продолжает загрузку с места обрыва: .part остаётся на диске между попытками
+    start = time.perf_counter()
+    stats.in_flight += 1
+    try:
+        for attempt in range(retries + 1):
+            try:
+                deduplicated = await download_image(session, manifest, index, stats, chunk_size)
+            except Exception as e:
+                if attempt == retries or not _is_retryable(e):
+                    stats.errors[index] = str(e) or type(e).__name__
+                    return
+                stats.retries += 1
+                await asyncio.sleep(_backoff_delay(attempt))
+            else:
+                stats.completed += 1
+                stats.deduplicated += deduplicated
+                stats.latencies.append(time.perf_counter() - start)
+                return
+    finally:
+        stats.in_flight -= 1
 
-async def download_images_async(num_images: int, save_dir: str):
+
+async def _download_worker(session: aiohttp.ClientSession, manifest: DownloadManifest, queue: asyncio.Queue,
+                           stats: DownloadStats, chunk_size: int, retries: int):
+    while True:
+        index = await queue.get()
+        try:
+            if index is None:
+                return
+            await download_with_retries(session, manifest, index, stats, chunk_size, retries)
+        finally:
+            queue.task_done()
+
+
+async def download_images_async(num_images: int, save_dir: str, concurrency: int = DEFAULT_CONCURRENCY,
+                                limit_per_host: int = 0, indices=None, chunk_size: int = CHUNK_SIZE,
+                                request_timeout: float = REQUEST_TIMEOUT, job_timeout: float = None,
+                                retries: int = MAX_RETRIES, progress: bool = True) -> dict:
+    # При concurrency < 1 не запустится ни один воркер и индексы молча останутся не загруженными
+    if concurrency < 1:
+        raise ValueError(f"concurrency должно быть не меньше 1, получено {concurrency}")
     Path(save_dir).mkdir(parents=True, exist_ok=True)
+    manifest = DownloadManifest(save_dir)
+    indices = indices if indices is not None else range(num_images)
+    stats = DownloadStats(len(indices) if hasattr(indices, '__len__') else None)
+
+    def not_complete():
+        # Индексы фильтруются лениво, список всех индексов в памяти не строится
+        for index in indices:
+            if manifest.is_complete(index):
+                stats.skipped += 1
+            else:
+                yield index
+
+    pending = not_complete()
+    first = next(pending, None)
+    # Повторный запуск завершённой задачи не открывает ни одного соединения
+    if first is None:
+        return stats.summary()
+    pending = itertools.chain([first], pending)
+
+    connector = aiohttp.TCPConnector(
+        limit=concurrency,
+        limit_per_host=limit_per_host,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+    )
+    # Очередь ограничена, поэтому индексы берутся из генератора по мере освобождения воркеров
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    timeout = aiohttp.ClientTimeout(total=request_timeout, sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
 
-    async with aiohttp.ClientSession() as session:
-        tasks = []
-        for i in range(num_images):
-            task = asyncio.create_task(download_image(session, save_dir, i))
-            tasks.append(task)
+    async def run(session):
+        workers = [
+            asyncio.create_task(_download_worker(session, manifest, queue, stats, chunk_size, retries))
+            for _ in range(concurrency)
+        ]
+        try:
+            for index in pending:
+                await queue.put(index)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
 
-        await asyncio.gather(*tasks)
+    reporter = asyncio.create_task(_report_progress(stats)) if progress else None
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        try:
+            await asyncio.wait_for(run(session), job_timeout)
+        except asyncio.TimeoutError:
+            # Недокачанные файлы остаются в .part и продолжатся при следующем запуске
+            stats.timed_out = True
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+                await asyncio.gather(reporter, return_exceptions=True)
+            await manifest.flush(force=True)
+    return stats.summary()
 
 
 if __name__ == "__main__":
@@ -43,7 +427,20 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Асинхронная загрузка случайных изображений с picsum.photos')
     parser.add_argument('--count', type=int, required=True, help='Количество изображений для загрузки')
     parser.add_argument('--dir', type=str, default='downloaded_images', help='Папка для сохранения изображений')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='Максимум одновременных загрузок')
+    parser.add_argument('--per-host', type=int, default=0, help='Максимум соединений на один хост (0 - без отдельного лимита)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Размер блока чтения и записи в байтах')
+    parser.add_argument('--timeout', type=float, default=REQUEST_TIMEOUT, help='Таймаут одного запроса в секундах')
+    parser.add_argument('--job-timeout', type=float, default=None, help='Таймаут всей загрузки в секундах')
+    parser.add_argument('--retries', type=int, default=MAX_RETRIES, help='Число повторов при ошибках 5xx и сбоях соединения')
+    parser.add_argument('--quiet', action='store_true', help='Не выводить прогресс в stderr')
 
     args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error('--concurrency должно быть не меньше 1')
 
-    asyncio.run(download_images_async(args.count, args.dir))
\ No newline at end of file
+    summary = asyncio.run(download_images_async(
+        args.count, args.dir, args.concurrency, args.per_host, chunk_size=args.chunk_size,
+        request_timeout=args.timeout, job_timeout=args.job_timeout, retries=args.retries, progress=not args.quiet,
+    ))
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
\ No newline at end of file
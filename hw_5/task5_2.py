@@ -1,105 +1,171 @@
 import aiohttp
 import asyncio
-from bs4 import BeautifulSoup
 import json
 import os
+import time
 from datetime import datetime
 from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 import argparse
 
-
-class AsyncRealtyScraper:
-    def __init__(self, storage_dir="realty_data", check_interval=3600):
+from http_cache import HTTP_CACHE_MAX_BYTES
+from realty_parsing import DEFAULT_BACKEND, DEFAULT_PARSE_WORKERS, PARSER_BACKENDS, ListingScraper
+
+DEFAULT_MAX_PAGES = 20
+PAGE_RETRIES = 2  # Повторы страницы, которую не удалось загрузить
+MAX_FAILED_PAGES = 3  # После стольких пропущенных страниц источник считается недоступным
+
+# Первая страница выдачи, параметр номера страницы и бюджет запросов: страниц одновременно и запросов в секунду
+SOURCES = {
+    'cian': {
+        'url': 'https://www.cian.ru/cat.php?currency=2&deal_type=rent&engine_version=2&offer_type=flat&region=1',
+        'page_param': 'p',
+        'concurrency': 2,
+        'rps': 0.5,
+    },
+    'yandex': {
+        'url': 'https://realty.yandex.ru/moskva_i_moskovskaya_oblast/snyat/kvartira/',
+        'page_param': 'page',
+        'concurrency': 2,
+        'rps': 0.5,
+    },
+    'avito': {
+        'url': 'https://www.avito.ru/moskva/kvartiry/sdam/na_dlitelnyy_srok',
+        'page_param': 'p',
+        'concurrency': 1,
+        'rps': 0.25,
+    },
+}
+
+
+def page_url(url, param, page):
+    if page == 1:
+        return url
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query) if key != param]
+    query.append((param, str(page)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+class TokenBucket:
+    # Не больше rate запросов в секунду с запасом burst; ожидающие получают токены по очереди
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = None
+
+    async def acquire(self):
+        if not self.rate:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncRealtyScraper(ListingScraper):
+    def __init__(self, storage_dir="realty_data", check_interval=3600, parser_backend=DEFAULT_BACKEND,
+                 use_strainer=True, parse_workers=DEFAULT_PARSE_WORKERS, pages_dir=None,
+                 cache_max_bytes=HTTP_CACHE_MAX_BYTES, max_pages=DEFAULT_MAX_PAGES, concurrency=None, rps=None):
         self.storage_dir = Path(storage_dir)
-        self.check_interval = check_interval
-        self.user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        self.headers = {"User-Agent": self.user_agent}
         self.storage_dir.mkdir(exist_ok=True)
-
-    async def fetch(self, session, url):
-        try:
-            async with session.get(url, headers=self.headers) as response:
-                if response.status == 200:
-                    return await response.text()
-                print(f"Ошибка {response.status} при запросе {url}")
-                return None
-        except Exception as e:
-            print(f"Ошибка при запросе {url}: {str(e)}")
+        super().__init__(self.storage_dir / "http_cache", parser_backend, use_strainer, parse_workers, cache_max_bytes)
+        self.check_interval = check_interval
+        # Если задано, загруженные страницы сохраняются для бенчмарка парсеров (realty_parsing.py)
+        self.pages_dir = Path(pages_dir) if pages_dir else None
+        self.max_pages = max_pages
+        # Если заданы, заменяют бюджет из SOURCES для всех источников
+        self.concurrency = concurrency
+        self.rps = rps
+        self._buckets = {}
+        self.known_urls = None
+
+    async def _scrape(self, session, source, url):
+        # None - страницу не удалось загрузить, [] - страница загружена, но объявлений на ней нет
+        page = await self.fetch_page(session, url)
+        if not page:
             return None
 
-    async def scrape_cian(self, session, url):
-        html = await self.fetch(session, url)
-        if not html:
-            return []
-
-        soup = BeautifulSoup(html, 'html.parser')
-        offers = []
-
-        for item in soup.select('article[data-name="CardComponent"]'):
-            try:
-                offer = {
-                    'source': 'cian',
-                    'title': item.select_one('[data-name="TitleComponent"]').get_text(strip=True),
-                    'price': item.select_one('[data-mark="MainPrice"]').get_text(strip=True),
-                    'address': item.select_one('[data-name="GeoLabel"]').get_text(strip=True),
-                    'url': "https://cian.ru" + item.select_one('a[data-name="LinkArea"]')['href'],
-                    'date': datetime.now().isoformat()
-                }
-                offers.append(offer)
-            except Exception as e:
-                print(f"Ошибка парсинга объявления CIAN: {str(e)}")
-                continue
+        if self.pages_dir and page.status == 200:
+            self.pages_dir.mkdir(parents=True, exist_ok=True)
+            (self.pages_dir / f"{source}_{page.digest[:16]}.html").write_text(page.text, encoding='utf-8')
 
-        return offers
+        offers = await self._parse(source, page)
+        date = datetime.now().isoformat()
+        return [{**offer, 'date': date} for offer in offers]
 
-    async def scrape_yandex(self, session, url):
-        html = await self.fetch(session, url)
-        if not html:
-            return []
-
-        soup = BeautifulSoup(html, 'html.parser')
-        offers = []
-
-        for item in soup.select('article[data-test="offer-card"]'):
-            try:
-                offer = {
-                    'source': 'yandex',
-                    'title': item.select_one('span[data-test="offer-title"]').get_text(strip=True),
-                    'price': item.select_one('span[data-test="offer-price"]').get_text(strip=True),
-                    'address': item.select_one('div[data-test="address"]').get_text(strip=True),
-                    'url': "https://realty.yandex.ru" + item.find('a')['href'],
-                    'date': datetime.now().isoformat()
-                }
-                offers.append(offer)
-            except Exception as e:
-                print(f"Ошибка парсинга объявления Яндекс: {str(e)}")
-                continue
+    async def scrape_cian(self, session, url):
+        return await self._scrape(session, 'cian', url) or []
 
-        return offers
+    async def scrape_yandex(self, session, url):
+        return await self._scrape(session, 'yandex', url) or []
 
     async def scrape_avito(self, session, url):
-        html = await self.fetch(session, url)
-        if not html:
-            return []
-
-        soup = BeautifulSoup(html, 'html.parser')
-        offers = []
-
-        for item in soup.select('div[data-marker="item"]'):
-            try:
-                offer = {
-                    'source': 'avito',
-                    'title': item.select_one('h3[itemprop="name"]').get_text(strip=True),
-                    'price': item.select_one('meta[itemprop="price"]')['content'] + " ₽",
-                    'address': item.select_one('[data-marker="item-address"]').get_text(strip=True),
-                    'url': "https://www.avito.ru" + item.select_one('a[data-marker="item-title"]')['href'],
-                    'date': datetime.now().isoformat()
-                }
-                offers.append(offer)
-            except Exception as e:
-                print(f"Ошибка парсинга объявления Авито: {str(e)}")
-                continue
+        return await self._scrape(session, 'avito', url) or []
+
+    def _bucket(self, url, rps):
+        host = urlsplit(url).netloc
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(rps)
+        return self._buckets[host]
 
+    def _load_known_urls(self):
+        urls = set()
+        for filename in self.storage_dir.glob("offers_*.json"):
+            with open(filename, 'r', encoding='utf-8') as f:
+                urls.update(o['url'] for o in json.load(f))
+        return urls
+
+    async def crawl(self, session, source):
+        config = SOURCES[source]
+        concurrency = self.concurrency or config['concurrency']
+        bucket = self._bucket(config['url'], self.rps if self.rps is not None else config['rps'])
+
+        async def scrape_page(page, attempt=0):
+            await bucket.acquire()
+            url = page_url(config['url'], config['page_param'], page)
+            return page, attempt, await self._scrape(session, source, url)
+
+        known = self.known_urls or set()
+        offers, seen, failed = [], set(), []
+        pending, next_page, last_page = set(), 1, self.max_pages
+        while pending or next_page <= last_page:
+            # Скользящее окно: новая страница запрашивается, как только освобождается место
+            while next_page <= last_page and len(pending) < concurrency:
+                pending.add(asyncio.ensure_future(scrape_page(next_page)))
+                next_page += 1
+
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                page, attempt, page_offers = task.result()
+                # Ошибка загрузки не означает конец выдачи: страницу повторяем, а после исчерпания повторов пропускаем
+                if page_offers is None:
+                    if attempt < PAGE_RETRIES:
+                        pending.add(asyncio.ensure_future(scrape_page(page, attempt + 1)))
+                        continue
+                    failed.append(page)
+                    if len(failed) >= MAX_FAILED_PAGES:
+                        last_page = min(last_page, next_page - 1)
+                    continue
+
+                fresh = [o for o in page_offers if o['url'] not in known and o['url'] not in seen]
+                seen.update(o['url'] for o in page_offers)
+                offers.extend(page_offers)
+                # Пустая страница или страница только из известных объявлений - дальше идут уже виденные
+                if not fresh:
+                    last_page = min(last_page, page)
+
+        print(f"{source}: страниц {next_page - 1}, объявлений {len(offers)}"
+              + (f", не загружены страницы {sorted(failed)}" if failed else ""))
         return offers
 
     async def save_offers(self, offers):
@@ -119,25 +185,22 @@ class AsyncRealtyScraper:
             with open(filename, 'w', encoding='utf-8') as f:
                 json.dump(all_offers, f, ensure_ascii=False, indent=2)
             print(f"Найдено {len(new_offers)} новых объявлений. Всего сохранено: {len(all_offers)}")
+            if self.known_urls is not None:
+                self.known_urls.update(o['url'] for o in new_offers)
         else:
             print("Новых объявлений не найдено")
 
     async def run_once(self):
-        urls = {
-            'cian': 'https://www.cian.ru/cat.php?currency=2&deal_type=rent&engine_version=2&offer_type=flat&region=1',
-            'yandex': 'https://realty.yandex.ru/moskva_i_moskovskaya_oblast/snyat/kvartira/',
-            'avito': 'https://www.avito.ru/moskva/kvartiry/sdam/na_dlitelnyy_srok'
-        }
+        if self.known_urls is None:
+            self.known_urls = self._load_known_urls()
 
+        # Источники обходятся параллельно, у каждого свой бюджет запросов
         async with aiohttp.ClientSession() as session:
-            tasks = [
-                self.scrape_cian(session, urls['cian']),
-                self.scrape_yandex(session, urls['yandex']),
-                self.scrape_avito(session, urls['avito'])
-            ]
-            results = await asyncio.gather(*tasks)
+            results = await asyncio.gather(*(self.crawl(session, source) for source in SOURCES))
             all_offers = [offer for sublist in results for offer in sublist]
             await self.save_offers(all_offers)
+        await self.http_cache.flush()
+        print(f"HTTP-кэш: {self.http_cache.stats}")
 
     async def run_periodically(self):
         while True:
@@ -152,10 +215,23 @@ if __name__ == "__main__":
     parser.add_argument('--once', action='store_true', help='Запустить однократное сканирование')
     parser.add_argument('--interval', type=int, default=3600, help='Интервал сканирования в секундах')
     parser.add_argument('--dir', type=str, default='realty_data', help='Директория для сохранения данных')
+    parser.add_argument('--parser', type=str, default=DEFAULT_BACKEND, choices=PARSER_BACKENDS, help='Парсер HTML')
+    parser.add_argument('--no-strainer', action='store_true', help='Строить дерево всей страницы, а не только карточек')
+    parser.add_argument('--parse-workers', type=int, default=DEFAULT_PARSE_WORKERS,
+                        help='Процессы для разбора страниц (0 - разбор в цикле событий)')
+    parser.add_argument('--save-pages', type=str, default=None, help='Папка для сохранения загруженных страниц')
+    parser.add_argument('--cache-size', type=int, default=HTTP_CACHE_MAX_BYTES, help='Размер HTTP-кэша на диске в байтах')
+    parser.add_argument('--max-pages', type=int, default=DEFAULT_MAX_PAGES, help='Максимум страниц выдачи на источник')
+    parser.add_argument('--concurrency', type=int, default=None, help='Страниц одновременно на источник')
+    parser.add_argument('--rps', type=float, default=None, help='Запросов в секунду на источник (0 - без ограничения)')
 
     args = parser.parse_args()
 
-    scraper = AsyncRealtyScraper(storage_dir=args.dir, check_interval=args.interval)
+    scraper = AsyncRealtyScraper(
+        storage_dir=args.dir, check_interval=args.interval, parser_backend=args.parser,
+        use_strainer=not args.no_strainer, parse_workers=args.parse_workers, pages_dir=args.save_pages,
+        cache_max_bytes=args.cache_size, max_pages=args.max_pages, concurrency=args.concurrency, rps=args.rps
+    )
 
     if args.once:
         asyncio.run(scraper.run_once())
@@ -9,7 +9,9 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.filters import Command, StateFilter
 import aiohttp
-from bs4 import BeautifulSoup
+
+from http_cache import HTTP_CACHE_MAX_BYTES
+from realty_parsing import DEFAULT_BACKEND, DEFAULT_PARSE_WORKERS, ListingScraper
 
 TOKEN = ''
 ARTIFACTS_DIR = Path("hw_5/artifacts")
@@ -17,6 +19,7 @@ ARTIFACTS_DIR.mkdir(parents=True, exist_ok=True)
 SUBSCRIPTIONS_FILE = ARTIFACTS_DIR / "subscriptions.json"
 OFFERS_FILE = ARTIFACTS_DIR / "offers.json"
 NOTIFICATIONS_FILE = ARTIFACTS_DIR / "notifications.json"
+HTTP_CACHE_DIR = ARTIFACTS_DIR / "http_cache"
 NOTIFICATION_DELAY = 5  # Задержка между уведомлениями в секундах
 MAX_DAILY_NOTIFICATIONS = 5  # Максимальное количество уведомлений в день
 
@@ -107,99 +110,32 @@ class UserSubscription:
         )
 
 
-class RealtyScraper:
-    def __init__(self):
-        self.user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        self.headers = {"User-Agent": self.user_agent}
+class RealtyScraper(ListingScraper):
+    def __init__(self, parser_backend=DEFAULT_BACKEND, use_strainer=True, parse_workers=DEFAULT_PARSE_WORKERS,
+                 cache_max_bytes=HTTP_CACHE_MAX_BYTES):
+        super().__init__(HTTP_CACHE_DIR, parser_backend, use_strainer, parse_workers, cache_max_bytes)
 
-    async def fetch(self, session, url):
-        try:
-            async with session.get(url, headers=self.headers) as response:
-                if response.status == 200:
-                    return await response.text()
-                print(f"Ошибка {response.status} при запросе {url}")
-                return None
-        except Exception as e:
-            print(f"Ошибка при запросе {url}: {str(e)}")
-            return None
+    async def _scrape(self, session, source, url):
+        page = await self.fetch_page(session, url)
+        if not page:
+            return []
+
+        # Разбор идёт в пуле процессов, чтобы большая страница не задерживала обработчики бота
+        offers = await self._parse(source, page)
+        timestamp = datetime.now().isoformat()
+        return [RealtyOffer(**offer, timestamp=timestamp) for offer in offers]
 
     async def scrape_cian(self, session):
         url = 'https://www.cian.ru/cat.php?currency=2&deal_type=rent&engine_version=2&offer_type=flat&region=1'
-        html = await self.fetch(session, url)
-        if not html:
-            return []
-
-        soup = BeautifulSoup(html, 'html.parser')
-        offers = []
-
-        for item in soup.select('article[data-name="CardComponent"]'):
-            try:
-                offer = RealtyOffer(
-                    source='cian',
-                    title=item.select_one('[data-name="TitleComponent"]').get_text(strip=True),
-                    price=item.select_one('[data-mark="MainPrice"]').get_text(strip=True),
-                    address=item.select_one('[data-name="GeoLabel"]').get_text(strip=True),
-                    url="https://cian.ru" + item.select_one('a[data-name="LinkArea"]')['href'],
-                    timestamp=datetime.now().isoformat()
-                )
-                offers.append(offer)
-            except Exception as e:
-                print(f"Ошибка парсинга объявления CIAN: {str(e)}")
-                continue
-
-        return offers
+        return await self._scrape(session, 'cian', url)
 
     async def scrape_yandex(self, session):
         url = 'https://realty.yandex.ru/moskva_i_moskovskaya_oblast/snyat/kvartira/'
-        html = await self.fetch(session, url)
-        if not html:
-            return []
-
-        soup = BeautifulSoup(html, 'html.parser')
-        offers = []
-
-        for item in soup.select('article[data-test="offer-card"]'):
-            try:
-                offer = RealtyOffer(
-                    source='yandex',
-                    title=item.select_one('span[data-test="offer-title"]').get_text(strip=True),
-                    price=item.select_one('span[data-test="offer-price"]').get_text(strip=True),
-                    address=item.select_one('div[data-test="address"]').get_text(strip=True),
-                    url="https://realty.yandex.ru" + item.find('a')['href'],
-                    timestamp=datetime.now().isoformat()
-                )
-                offers.append(offer)
-            except Exception as e:
-                print(f"Ошибка парсинга объявления Яндекс: {str(e)}")
-                continue
-
-        return offers
+        return await self._scrape(session, 'yandex', url)
 
     async def scrape_avito(self, session):
         url = 'https://www.avito.ru/moskva/kvartiry/sdam/na_dlitelnyy_srok'
-        html = await self.fetch(session, url)
-        if not html:
-            return []
-
-        soup = BeautifulSoup(html, 'html.parser')
-        offers = []
-
-        for item in soup.select('div[data-marker="item"]'):
-            try:
-                offer = RealtyOffer(
-                    source='avito',
-                    title=item.select_one('h3[itemprop="name"]').get_text(strip=True),
-                    price=item.select_one('meta[itemprop="price"]')['content'] + " ₽",
-                    address=item.select_one('[data-marker="item-address"]').get_text(strip=True),
-                    url="https://www.avito.ru" + item.select_one('a[data-marker="item-title"]')['href'],
-                    timestamp=datetime.now().isoformat()
-                )
-                offers.append(offer)
-            except Exception as e:
-                print(f"Ошибка парсинга объявления Авито: {str(e)}")
-                continue
-
-        return offers
+        return await self._scrape(session, 'avito', url)
 
     async def scrape_all(self):
         async with aiohttp.ClientSession() as session:
@@ -209,7 +145,8 @@ class RealtyScraper:
                 self.scrape_avito(session)
             ]
             results = await asyncio.gather(*tasks)
-            return [offer for sublist in results for offer in sublist]
+        await self.http_cache.flush()
+        return [offer for sublist in results for offer in sublist]
 
 
 def load_subscriptions():